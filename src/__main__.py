@@ -0,0 +1,152 @@
+# ==========================================================
+#  __main__.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+#
+#  Single entry point for every stage of the pipeline:
+#      python -m src <command> [args]
+#  Only the standard library is imported here; each command imports its
+#  stage (and pandas, sklearn, matplotlib...) when it runs.
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+# Stages without options: command -> (module, help)
+STAGES = {
+    "prepare": ("data_preparation", "Combines the season CSVs into LaLiga_combined.csv"),
+    "players": ("players_info_preparation", "Players and lineups of every match"),
+    "features": ("feature_engineering", "Builds laliga_features.csv"),
+    "values": ("calculate_market_values", "Adds the squad market values to laliga_features.csv"),
+    "scrape": ("get_transfermarket_values", "Scrapes the Transfermarkt squad values"),
+}
+# Commands with their own argparse: the remaining arguments are passed to module.main(argv)
+TOOLS = {
+    "report": ("reporte_exploracion", "Exploratory report of the feature tables (headless, single pass)"),
+    "train": ("training", "Trains the result_abstract RandomForest"),
+    "predict": ("predict", "Predicts upcoming fixtures (snapshot, fixture, batch, serve)"),
+    "backtest": ("backtest", "Walk-forward backtest with periodic retraining"),
+    "ablation": ("ablation", "Feature-group ablation with the training CV"),
+    "simulate": ("season_simulator", "Monte Carlo simulation of the rest of a season"),
+    "scoreline": ("scoreline_model", "Dixon-Coles scoreline baseline"),
+    "odds": ("market_odds", "Multi-bookmaker odds (LaLiga_odds.csv) and de-vig comparison"),
+    "store": ("feature_store", "Point-in-time feature store"),
+    "validate": ("validation", "Data-quality checks of the data/processed artifacts"),
+}
+
+ARTIFACTS = [
+    os.path.join('data', 'processed', 'LaLiga_combined.csv'),
+    os.path.join('data', 'processed', 'laliga_features.csv'),
+    os.path.join('data', 'processed', 'laliga_features_lineups.npz'),
+    os.path.join('data', 'processed', 'players_with_market_values.csv'),
+    os.path.join('data', 'processed', 'matches_final_info.csv'),
+    os.path.join('models', 'rf_result_abstract.joblib'),
+    os.path.join('data', 'cache', 'snapshot.npz'),
+    os.path.join('data', 'cache', 'forest.npz'),
+    os.path.join('data', 'feature_store', 'meta.json'),
+]
+
+
+def run_module(name : str, argv=None):
+    import importlib
+
+    module = importlib.import_module(name)
+    return module.main() if argv is None else module.main(argv)
+
+
+def count_rows(path : str):
+    with open(path, 'rb') as f:
+        return max(sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b'')) - 1, 0)
+
+
+def status():
+    """
+    Size, date and rows of the pipeline outputs, without importing pandas
+    """
+    root = os.path.normpath(os.path.join(base_dir, '..'))
+    for relative in ARTIFACTS:
+        path = os.path.join(root, relative)
+        if not os.path.exists(path):
+            print(f"  {relative:<48} missing")
+            continue
+        modified = time.strftime('%Y-%m-%d %H:%M', time.localtime(os.path.getmtime(path)))
+        rows = f"{count_rows(path):>7} filas" if path.endswith('.csv') else ""
+        print(f"  {relative:<48} {os.path.getsize(path) / 1e6:8.2f} MB  {modified}  {rows}")
+
+
+def parse_importtime(stderr : str):
+    """
+    Seconds of a -X importtime log per root package (self times of all its modules, wherever
+    they were imported from), and the other lines of stderr
+    """
+    packages, other = {}, []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            other.append(line)
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        package = fields[2].strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(fields[0]) / 1e6
+    return packages, other
+
+
+def import_profile(argv : list[str], top=15):
+    """
+    Runs the command again under python -X importtime and prints the packages that take longest to import
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', base_dir, *argv], stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    packages, other = parse_importtime(result.stderr)
+    if other:
+        print('\n'.join(other), file=sys.stderr)
+
+    print(f"\nImports: {sum(packages.values()):.3f}s de {elapsed:.3f}s ({len(packages)} paquetes)")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {seconds:8.3f}s  {package}")
+    return result.returncode
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src", description="Football prediction pipeline")
+    parser.add_argument("--import-profile", action="store_true",
+                        help="Runs the command under -X importtime and prints the slowest imports")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command, (_, help_text) in STAGES.items():
+        sub.add_parser(command, help=help_text)
+    for command, (_, help_text) in TOOLS.items():
+        sub.add_parser(command, help=help_text, add_help=False)
+    sub.add_parser("status", help="Outputs of the pipeline and their age")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Everything after a tool command (--help included) belongs to the tool's own parser
+    split = next((i + 1 for i, a in enumerate(argv) if a in TOOLS), len(argv))
+    args = build_parser().parse_args(argv[:split])
+    if args.import_profile:
+        return import_profile([a for a in argv if a != "--import-profile"])
+
+    if args.command == "status":
+        status()
+    elif args.command in STAGES:
+        run_module(STAGES[args.command][0])
+    else:
+        sys.argv[0] = f"python -m src {args.command}"
+        run_module(TOOLS[args.command][0], argv[split:])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+# ==========================================================
+#  ablation.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import training
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+reports_dir = os.path.normpath(os.path.join(base_dir, '..', 'data', 'reports'))
+
+# The features of FEATURE_SELECTION by group. The matrix is built with the columns in this
+# order, so the columns of a group are one contiguous block.
+FEATURE_GROUPS = {
+    "elo": ["elo_home", "elo_away", "elo_diff"],
+    "form": [
+        "home_avg_goals_scored_7", "away_avg_goals_scored_7",
+        "home_avg_goals_conceded_7", "away_avg_goals_conceded_7",
+        "goal_diff_form_home", "goal_diff_form_away", "total_avg_goals",
+        "attack_strength_home", "attack_strength_away",
+        "defense_strength_home", "defense_strength_away",
+        "attack_vs_defense_home", "attack_vs_defense_away",
+    ],
+    "shots": [
+        "home_avg_shots_7", "away_avg_shots_7",
+        "home_avg_shots_on_target_7", "away_avg_shots_on_target_7",
+        "shots_on_target_ratio_home", "shots_on_target_ratio_away",
+        "home_avg_corners_7", "away_avg_corners_7",
+    ],
+    "discipline": [
+        "home_avg_fouls_7", "away_avg_fouls_7",
+        "home_avg_yellows_7", "away_avg_yellows_7",
+        "home_avg_reds_7", "away_avg_reds_7",
+        "discipline_index_home", "discipline_index_away",
+    ],
+    "market_value": ["home_team_value", "away_team_value", "team_value_diff", "team_value_ratio"],
+    "odds": ["B365H_prob", "B365D_prob", "B365A_prob", "prob_diff_home_away", "prob_fav_margin"],
+    "derby": ["derby"],
+}
+GROUPED_FEATURES = [f for features in FEATURE_GROUPS.values() for f in features]
+
+
+def group_ranges(groups=FEATURE_GROUPS):
+    """(start, stop) columns of every group in the grouped matrix"""
+    ranges, start = {}, 0
+    for name, features in groups.items():
+        ranges[name] = (start, start + len(features))
+        start += len(features)
+    return ranges
+
+
+def merge_ranges(ranges : list[tuple]):
+    """Joins adjacent column ranges, [(0, 3), (3, 16)] -> [(0, 16)]"""
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and merged[-1][1] == start:
+            merged[-1] = (merged[-1][0], stop)
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def experiments(groups : list[str], mode="drop"):
+    """
+    Column ranges of every experiment: all the features, each group dropped and/or each group alone.
+    Dropping the first or the last group leaves one block (a view of the matrix); a group in the
+    middle leaves two blocks, which are copied together.
+    """
+    ranges = group_ranges()
+    result = {"all": [(0, len(GROUPED_FEATURES))]}
+    for group in groups:
+        if mode in ("drop", "both"):
+            result[f"without_{group}"] = merge_ranges([r for g, r in ranges.items() if g != group])
+        if mode in ("only", "both"):
+            result[f"only_{group}"] = [ranges[group]]
+    return result
+
+
+def column_subset(X : np.ndarray, ranges : list[tuple]):
+    """
+    Columns of the experiment. One block is a slice of the Fortran-ordered matrix (a view,
+    contiguous per column); several blocks are concatenated (a copy).
+    """
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        return X[:, start:stop]
+    return np.asfortranarray(np.hstack([X[:, start:stop] for start, stop in ranges]))
+
+
+def fit_experiment_fold(X : np.ndarray, y : np.ndarray, ranges : list[tuple], bounds : np.ndarray, params : dict,
+                        n_classes : int):
+    """
+    Fits the forest with the columns of the experiment on one CV fold, returns accuracy and log loss
+    """
+    train_end, test_end = bounds
+    X_sub = column_subset(X, ranges)
+    model = training.make_model(params)
+    model.fit(X_sub[:train_end], y[:train_end])
+    proba = backtest.full_proba(model, X_sub[train_end:test_end], n_classes)
+    metrics = backtest.season_metrics(y[train_end:test_end], proba)
+    return {"accuracy": metrics["top1"], "log_loss": metrics["log_loss"]}
+
+
+def run_ablation(data : dict, runs : dict, params : dict, n_jobs=-1):
+    """
+    Every (experiment, fold) pair in parallel worker processes with the same folds as training.
+    Results are cached by data hash like the training trials, so reruns only fit the missing pairs.
+    """
+    from joblib import Parallel, delayed
+
+    X = np.asfortranarray(data["X_train"])
+    y = data["y_train"]
+    n_classes = len(data["classes"])
+    cache_key = f"ablation_{data['key']}"
+    trials = training.load_trials(cache_key)
+
+    def trial(name):
+        return {"params": params, "features": [GROUPED_FEATURES[i] for s, e in runs[name] for i in range(s, e)]}
+
+    folds = range(len(data["folds"]))
+    pending = [(name, fold) for name in runs for fold in folds
+               if (training.params_key(trial(name)), fold) not in trials]
+    start = time.perf_counter()
+    if pending:
+        scores = Parallel(n_jobs=n_jobs, return_as="generator")(
+            delayed(fit_experiment_fold)(X, y, runs[name], data["folds"][fold], params, n_classes)
+            for name, fold in pending
+        )
+        for (name, fold), score in zip(pending, scores):
+            trials[(training.params_key(trial(name)), fold)] = score
+            training.save_trials(cache_key, [{"params": trial(name), "fold": fold, "score": score}])
+    print(f"{len(runs)} experimentos x {len(folds)} folds: {len(pending)} ajustes en "
+          f"{time.perf_counter() - start:.1f}s, {len(runs) * len(folds) - len(pending)} reutilizados")
+
+    rows = []
+    for name, ranges in runs.items():
+        scores = [trials[(training.params_key(trial(name)), fold)] for fold in folds]
+        accuracy = np.array([s["accuracy"] for s in scores])
+        log_loss = np.array([s["log_loss"] for s in scores])
+        rows.append({
+            "experiment": name,
+            "features": sum(e - s for s, e in ranges),
+            "accuracy": accuracy.mean(),
+            "accuracy_std": accuracy.std(),
+            "log_loss": log_loss.mean(),
+            "log_loss_std": log_loss.std(),
+        })
+    table = pd.DataFrame(rows)
+    baseline = table.loc[table["experiment"] == "all"].iloc[0]
+    table["delta_accuracy"] = table["accuracy"] - baseline["accuracy"]
+    table["delta_log_loss"] = table["log_loss"] - baseline["log_loss"]
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Feature-group ablation with the training time-series CV")
+    parser.add_argument("--features", default=None, help="Path to laliga_features.csv")
+    parser.add_argument("--groups", nargs='+', choices=list(FEATURE_GROUPS), default=list(FEATURE_GROUPS))
+    parser.add_argument("--mode", choices=["drop", "only", "both"], default="drop")
+    parser.add_argument("--params", default=None, help="Forest params as JSON (default backtest.BEST_PARAMS)")
+    parser.add_argument("--n-splits", type=int, default=8)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--no-cache", action="store_true", help="Rebuilds the feature matrix cache")
+    parser.add_argument("--output", default=None, help="CSV with the comparison table")
+    args = parser.parse_args(argv)
+
+    params = json.loads(args.params) if args.params else backtest.BEST_PARAMS
+    df = training.clean_features(training.load_features(args.features))
+    data = training.build_fold_cache(df, GROUPED_FEATURES, args.n_splits, use_cache=not args.no_cache)
+    print(f"Matriz {data['X_train'].shape} float32, clave {data['key']}")
+
+    table = run_ablation(data, experiments(args.groups, args.mode), params, args.n_jobs)
+    table = table.sort_values("delta_log_loss", ascending=False).reset_index(drop=True)
+    pd.set_option('display.width', None)
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+
+    output = args.output or os.path.join(reports_dir, f"ablation_{data['key']}.csv")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    table.to_csv(output, index=False)
+    print(f"Archivo guardado en {output}")
+
+
+if __name__ == "__main__":
+    main()
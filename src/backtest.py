@@ -0,0 +1,172 @@
+# ==========================================================
+#  backtest.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import training
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+CADENCES = ("matchday", "month", "season")
+
+# Best hyperparameters of the RandomizedSearch in Modelling.ipynb
+BEST_PARAMS = {
+    "n_estimators": 200,
+    "max_depth": 6,
+    "min_samples_leaf": 30,
+    "min_samples_split": 20,
+    "max_features": 0.3,
+}
+
+
+def retrain_blocks(df : pd.DataFrame, cadence : str):
+    """
+    Block id for each row (df sorted by Date). The model is retrained before every block.
+    A matchday is a run of consecutive match days, a gap of 2+ days without matches starts a new one.
+    """
+    if cadence == "matchday":
+        new_block = df["Date"].diff().dt.days.fillna(0) > 1
+    elif cadence == "month":
+        month = df["Date"].dt.to_period("M")
+        new_block = month != month.shift()
+    elif cadence == "season":
+        new_block = df["Season"] != df["Season"].shift()
+    else:
+        raise ValueError(f"Unknown cadence {cadence}, expected one of {CADENCES}")
+    new_block.iloc[0] = True
+    return new_block.cumsum().to_numpy() - 1
+
+
+def build_chains(df : pd.DataFrame, blocks : np.ndarray, start_season : str):
+    """
+    Groups the blocks (start, end) by season. Each season is an independent chain:
+    seasons run in parallel and, with warm start, the forest grows block by block inside a season.
+    """
+    starts = np.flatnonzero(np.diff(blocks, prepend=-1))
+    ends = np.append(starts[1:], len(blocks))
+    seasons = df["Season"].to_numpy()
+
+    chains = {}
+    for start, end in zip(starts, ends):
+        season = seasons[start]
+        if season < start_season:
+            continue
+        chains.setdefault(season, []).append((int(start), int(end)))
+    return chains
+
+
+def full_proba(model, X : np.ndarray, n_classes : int):
+    """
+    predict_proba over all the classes, also those the model didn't see in train
+    """
+    proba = np.zeros((X.shape[0], n_classes), dtype=np.float64)
+    proba[:, model.classes_] = model.predict_proba(X)
+    return proba
+
+
+def run_chain(X : np.ndarray, y : np.ndarray, chain : list, params : dict, n_classes : int, warm_trees=0):
+    """
+    Walk-forward over the blocks of one season: before each block the model is trained with
+    every match played before it. With warm_trees > 0 the first block fits the whole forest and
+    the next ones only add warm_trees new trees on the updated data.
+    """
+    model = None
+    probas = []
+    for start, end in chain:
+        classes_seen = np.unique(y[:start])
+        warm = (
+            warm_trees > 0 and model is not None
+            and getattr(model, "warm_start", False)
+            and np.array_equal(model.classes_, classes_seen)
+        )
+        if warm:
+            model.set_params(n_estimators=model.n_estimators + warm_trees)
+        else:
+            model = training.make_model({**params, "warm_start": warm_trees > 0})
+        model.fit(X[:start], y[:start])
+        probas.append(full_proba(model, X[start:end], n_classes))
+    return probas
+
+
+def season_metrics(y : np.ndarray, proba : np.ndarray):
+    n = len(y)
+    rows = np.arange(n)
+    top3 = np.argpartition(-proba, 3, axis=1)[:, :3]
+    onehot = np.zeros_like(proba)
+    onehot[rows, y] = 1
+    return {
+        "matches": n,
+        "top1": float((proba.argmax(axis=1) == y).mean()),
+        "top3": float((top3 == y[:, None]).any(axis=1).mean()),
+        "log_loss": float(-np.log(np.clip(proba[rows, y], 1e-15, 1)).mean()),
+        "brier": float(((proba - onehot) ** 2).sum(axis=1).mean()),
+    }
+
+
+def backtest(df : pd.DataFrame, features=training.FEATURE_SELECTION, params=BEST_PARAMS, cadence="matchday",
+             start_season=None, warm_trees=0, n_jobs=-1):
+    """
+    Walk-forward backtest over laliga_features. Returns the metrics per season.
+    """
+    from joblib import Parallel, delayed
+
+    X = training.feature_matrix(df, features)
+    classes, y = np.unique(df[training.TARGET].astype(str).to_numpy(), return_inverse=True)
+    if start_season is None:
+        start_season = sorted(df["Season"].unique())[1]
+
+    chains = build_chains(df, retrain_blocks(df, cadence), start_season)
+    n_fits = sum(len(c) for c in chains.values())
+    print(f"Backtest {cadence}: {len(chains)} temporadas, {n_fits} reentrenamientos")
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(run_chain)(X, y, chain, params, len(classes), warm_trees)
+        for chain in chains.values()
+    )
+
+    rows = []
+    for (season, chain), probas in zip(chains.items(), results):
+        idx = np.concatenate([np.arange(start, end) for start, end in chain])
+        rows.append({"Season": season, **season_metrics(y[idx], np.vstack(probas))})
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the result_abstract model")
+    parser.add_argument("--features", default=None, help="Path to laliga_features.csv")
+    parser.add_argument("--cadence", choices=CADENCES, default="matchday")
+    parser.add_argument("--start-season", default=None, help="First predicted season, e.g. 2006_07")
+    parser.add_argument("--warm-trees", type=int, default=0,
+                        help="Trees added on each retrain inside a season (0 refits from scratch)")
+    parser.add_argument("--params", default=None, help="Hyperparameters as JSON")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--output", default=None, help="CSV with the metrics per season")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    params = json.loads(args.params) if args.params else BEST_PARAMS
+    df = training.clean_features(training.load_features(args.features), prior_only=True)
+    metrics = backtest(df, training.FEATURE_SELECTION, params, args.cadence, args.start_season,
+                       args.warm_trees, args.n_jobs)
+
+    print(metrics.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    total = metrics[["top1", "top3", "log_loss", "brier"]].mul(metrics["matches"], axis=0).sum() / metrics["matches"].sum()
+    print("Total: " + ", ".join(f"{k} {v:.4f}" for k, v in total.items()))
+    if args.output:
+        metrics.to_csv(args.output, index=False)
+        print(f"Archivo guardado en {args.output}")
+    print(f"Tiempo total: {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
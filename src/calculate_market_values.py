@@ -1,10 +1,14 @@
-import ast
 import re
 import unicodedata
+import numpy as np
 import pandas as pd
 import os
 from difflib import SequenceMatcher
 
+import compact_schema
+import match_features
+import validation
+
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
 
@@ -49,19 +53,6 @@ def parse_market_values(v):
     return float(int(n))
 
 
-def parse_list(val):
-    if isinstance(val, list):
-        return val
-    if not isinstance(val, str):
-        return []
-    try:
-        val = ast.literal_eval(val)
-        if isinstance(val, list):
-            return [str(x) for x in val]
-    except Exception:
-        pass
-    return [x.strip() for x in val.split(",") if x.strip()]
-
 def token_set_score(a_norm: str, b_norm: str) -> float:
     sa, sb = set(a_norm.split()), set(b_norm.split())
     if not sa:
@@ -98,14 +89,28 @@ def match_player_value(pname_raw: str, season: str, team_norm: str, players_df:
     return 0.0
 
 
-def team_value(lineup, team_norm, season, players_df: pd.DataFrame) -> float:
-    if not isinstance(lineup, list) or not lineup:
-        return 0.0
-
-    total = 0.0
-    for raw_name in lineup:
-        total += match_player_value(raw_name, season, team_norm, players_df)
-    return float(total)
+def lineup_values(offsets : np.ndarray, ids : np.ndarray, vocab : dict, team_norm : pd.Series, season : pd.Series, players_df: pd.DataFrame) -> np.ndarray:
+    """
+    Sum of the player values of each lineup, given as the offset + id arrays of load_lineups,
+    so each (player, season, team) is matched once instead of once per match.
+    """
+    rows = compact_schema.lineup_rows(offsets)
+    names = np.empty(len(vocab), dtype=object)
+    for name, i in vocab.items():
+        names[i] = name
+
+    keys = pd.DataFrame({
+        "player": ids,
+        "Season": np.asarray(season, dtype=object)[rows],
+        "team_norm": np.asarray(team_norm, dtype=object)[rows],
+    })
+    unique = keys.drop_duplicates().reset_index(drop=True)
+    unique["value"] = [
+        match_player_value(names[player], s, team, players_df)
+        for player, s, team in unique.itertuples(index=False)
+    ]
+    values = keys.merge(unique, on=["player", "Season", "team_norm"], how="left")["value"].to_numpy()
+    return np.bincount(rows, weights=values, minlength=len(offsets) - 1)
 
 
 def load_player_values():
@@ -138,60 +143,48 @@ def write_csv(dataframe: pd.DataFrame, filename: str):
 
 
 def load_matches() -> pd.DataFrame:
-    path = os.path.join(base_dir, "..", "data", "processed", "laliga_features.csv")
-    path = os.path.normpath(path)
-    return pd.read_csv(path)
+    return compact_schema.read_features()
+
 
+def load_match_lineups() -> dict:
+    path = os.path.join(base_dir, "..", "data", "processed", "laliga_features_lineups.npz")
+    return compact_schema.load_lineups(os.path.normpath(path))
 
-def add_team_values_to_features(features: pd.DataFrame, players_df: pd.DataFrame):
+
+def add_team_values_to_features(features: pd.DataFrame, players_df: pd.DataFrame, lineups: dict):
     players_df["team_norm"] = players_df["team"].map(normalize_text)
     players_df["name_norm"] = players_df["name"].map(normalize_text)
     players_df["market_value"] = pd.to_numeric(players_df["market_value"], errors="coerce").fillna(0)
 
     features["home_team_norm"] = features["HomeTeam"].map(normalize_text)
     features["away_team_norm"] = features["AwayTeam"].map(normalize_text)
-    features["Home_Lineup_List"] = features["Home_Lineup_List"].apply(parse_list)
-    features["Away_Lineup_List"] = features["Away_Lineup_List"].apply(parse_list)
-
 
-    features["home_team_value"] = features.apply(
-        lambda row: team_value(row["Home_Lineup_List"], row["home_team_norm"], row["Season"], players_df),
-        axis=1,
+    features["home_team_value"] = lineup_values(
+        lineups["home_offsets"], lineups["home_ids"], lineups["vocab"], features["home_team_norm"], features["Season"], players_df
     )
-
-    features["away_team_value"] = features.apply(
-        lambda row: team_value(row["Away_Lineup_List"], row["away_team_norm"], row["Season"], players_df),
-        axis=1,
+    features["away_team_value"] = lineup_values(
+        lineups["away_offsets"], lineups["away_ids"], lineups["vocab"], features["away_team_norm"], features["Season"], players_df
     )
 
     return features
 
-def add_various_features(df : pd.DataFrame):
-    """
-    Various features, like team values diffs and statistic-related variables
-    """
-    df["team_value_diff"] = df["home_team_value"] - df["away_team_value"]
-    df["team_value_ratio"] = df["home_team_value"] / (df["away_team_value"] + 1)
-
-    df["shots_on_target_ratio_home"] = (df["home_avg_shots_on_target_7"] / (df["home_avg_shots_7"] + 1e-5))
-    df["shots_on_target_ratio_away"] = (df["away_avg_shots_on_target_7"] / (df["away_avg_shots_7"] + 1e-5))
-
-    df["attack_vs_defense_home"] = df["attack_strength_home"] - df["defense_strength_away"]
-    df["attack_vs_defense_away"] = df["attack_strength_away"] - df["defense_strength_home"]
-
-    df["total_avg_goals"] = (df["home_avg_goals_scored_7"] + df["away_avg_goals_scored_7"])
 
-    return df
-
-
-if __name__ == "__main__":
+def main():
     players_list = load_player_values()
     players_df = pd.concat(players_list,ignore_index=True)
+    validation.check_stage(players_df, "players_with_market_values.csv")
     write_csv(players_df, "players_with_market_values.csv")
 
     features = load_matches()
-    features = add_team_values_to_features(features, players_df)
+    usage = features.memory_usage(deep=True, index=False).sum()
+    features = add_team_values_to_features(features, players_df, load_match_lineups())
+    # The new value columns are summed in float64 and brought back to the compact schema
+    features = compact_schema.compact_frame(match_features.add_various_features(features))
+    print(f"Memoria: {usage / 1e6:.2f} MB leidos -> {features.memory_usage(deep=True, index=False).sum() / 1e6:.2f} MB con valores")
 
-    df_final = add_various_features(features)
+    validation.check_stage(features, "laliga_features.csv")
+    write_csv(features, "laliga_features.csv")
 
-    write_csv(df_final, "laliga_features.csv")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# ==========================================================
+#  compact_schema.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import os
+import numpy as np
+import pandas as pd
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Match counts (goals, shots, cards...) fit in int8
+COUNT_COLUMNS = [
+    'FTHG', 'FTAG', 'HTHG', 'HTAG', 'HS', 'AS', 'HST', 'AST', 'HF', 'AF',
+    'HC', 'AC', 'HY', 'AY', 'HR', 'AR', 'derby', 'market_n_books',
+]
+TEAM_COLUMNS = ['HomeTeam', 'AwayTeam']
+# Repeated labels, dictionary-encoded as categoricals
+LABEL_COLUMNS = ['Div', 'FTR', 'HTR', 'result_string', 'result_abstract', 'Season', 'home_team_norm', 'away_team_norm']
+LINEUP_COLUMNS = ['Home_Lineup_List', 'Away_Lineup_List']
+
+
+def team_dtype(df : pd.DataFrame):
+    """
+    One categorical for both team columns, so the same team has the same code (int8/int16) in each
+    """
+    teams = pd.concat([df[c].astype(str) for c in TEAM_COLUMNS if c in df.columns]).unique()
+    return pd.CategoricalDtype(sorted(teams))
+
+
+def compact_frame(df : pd.DataFrame):
+    """
+    Applies the compact schema: categorical teams and labels, int8 counts and float32 features.
+    Lineups and dates are left as they are. float32 values are written with their shortest repr,
+    so the CSV round-trips exactly when read back with read_features.
+    """
+    df = df.copy(deep=False)
+    if all(c in df.columns for c in TEAM_COLUMNS):
+        dtype = team_dtype(df)
+        for c in TEAM_COLUMNS:
+            df[c] = df[c].astype(str).astype(dtype)
+
+    for c in COUNT_COLUMNS:
+        if c in df.columns and pd.api.types.is_numeric_dtype(df[c]):
+            df[c] = df[c].astype('Int8' if df[c].isna().any() else 'int8')
+
+    for c in LABEL_COLUMNS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype('category')
+
+    for c in df.columns:
+        if c not in COUNT_COLUMNS and pd.api.types.is_float_dtype(df[c]) and df[c].dtype != np.float32:
+            df[c] = df[c].astype(np.float32)
+    return df
+
+
+def features_dtypes(columns):
+    """dtype of every column of laliga_features.csv under the compact schema (Date excluded)"""
+    dtypes = {}
+    for c in columns:
+        if c == 'Date' or c in LINEUP_COLUMNS:
+            continue
+        if c in COUNT_COLUMNS:
+            dtypes[c] = 'Int8'
+        elif c in TEAM_COLUMNS or c in LABEL_COLUMNS:
+            dtypes[c] = 'category'
+        else:
+            dtypes[c] = np.float32
+    return dtypes
+
+
+def read_features(path=None, lineups=False):
+    """
+    Reads laliga_features.csv with the compact dtypes pinned, so no float64 or object copy is
+    ever built. lineups=True adds the lineup lists from laliga_features_lineups.npz.
+    """
+    if path is None:
+        path = os.path.join(base_dir, '..', 'data', 'processed', 'laliga_features.csv')
+    path = os.path.normpath(path)
+    columns = pd.read_csv(path, nrows=0).columns
+    df = pd.read_csv(path, dtype=features_dtypes(columns), parse_dates=['Date'] if 'Date' in columns else False)
+    df = compact_frame(df)
+    if lineups:
+        cached = load_lineups(path.replace('.csv', '_lineups.npz'))
+        df['Home_Lineup_List'] = decode_lineups(cached['home_offsets'], cached['home_ids'], cached['vocab'])
+        df['Away_Lineup_List'] = decode_lineups(cached['away_offsets'], cached['away_ids'], cached['vocab'])
+    return df
+
+
+def encode_lineups(lineups : pd.Series, vocab=None):
+    """
+    Lineups (lists of player names) as offset + id arrays: the players of row i are
+    vocab[ids[offsets[i]:offsets[i + 1]]]. vocab can be shared between home and away lineups.
+    """
+    if vocab is None:
+        vocab = {}
+    lengths = np.zeros(len(lineups), dtype=np.int32)
+    ids = []
+    for i, lineup in enumerate(lineups):
+        if not isinstance(lineup, list):
+            continue
+        lengths[i] = len(lineup)
+        for player in lineup:
+            ids.append(vocab.setdefault(player, len(vocab)))
+    offsets = np.zeros(len(lineups) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets, np.asarray(ids, dtype=np.int32), vocab
+
+
+def decode_lineups(offsets : np.ndarray, ids : np.ndarray, vocab : dict):
+    names = np.empty(len(vocab), dtype=object)
+    for name, i in vocab.items():
+        names[i] = name
+    return [names[ids[offsets[i]:offsets[i + 1]]].tolist() for i in range(len(offsets) - 1)]
+
+
+def lineup_rows(offsets : np.ndarray):
+    """Row of every entry of ids"""
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def save_lineups(path : str, home : pd.Series, away : pd.Series):
+    """
+    Writes both lineup columns encoded with a shared vocab: home_offsets, home_ids, away_offsets,
+    away_ids and vocab (player names by id)
+    """
+    home_offsets, home_ids, vocab = encode_lineups(home)
+    away_offsets, away_ids, vocab = encode_lineups(away, vocab)
+    names = np.empty(len(vocab), dtype=object)
+    for name, i in vocab.items():
+        names[i] = name
+    np.savez(path, home_offsets=home_offsets, home_ids=home_ids, away_offsets=away_offsets,
+             away_ids=away_ids, vocab=names.astype(str))
+    print(f"Archivo guardado en {path}")
+
+
+def load_lineups(path : str):
+    """Arrays of save_lineups, with vocab as {name: id} for decode_lineups"""
+    with np.load(path, allow_pickle=False) as cached:
+        lineups = {name: cached[name] for name in cached.files}
+    lineups["vocab"] = {name: i for i, name in enumerate(lineups["vocab"].tolist())}
+    return lineups
+
+
+def lineup_nbytes(offsets : np.ndarray, ids : np.ndarray, vocab=None):
+    """Bytes of an encoded lineup column (the shared vocab is counted when given)"""
+    nbytes = offsets.nbytes + ids.nbytes
+    if vocab is not None:
+        nbytes += sum(len(name.encode('utf-8')) + 8 for name in vocab)
+    return nbytes
+
+
+def frame_usage(df : pd.DataFrame):
+    """dtype and bytes per column, so the report can be made after the frame is dropped"""
+    return pd.DataFrame({'dtype': df.dtypes.astype(str), 'bytes': df.memory_usage(deep=True, index=False)})
+
+
+def memory_report(before : pd.DataFrame, after : pd.DataFrame, lineup_bytes=None):
+    """
+    Bytes per column before (frame_usage of the raw frame) and after the compact schema.
+    lineup_bytes ({column: bytes}) gives the size of the offset + id arrays that replace the
+    lineup lists.
+    """
+    b = before['bytes']
+    a = after.memory_usage(deep=True, index=False).reindex(b.index)
+    report = pd.DataFrame({
+        'dtype_before': before['dtype'],
+        'bytes_before': b,
+        'dtype_after': after.dtypes.reindex(b.index).astype(str),
+        'bytes_after': a,
+    })
+    for c, nbytes in (lineup_bytes or {}).items():
+        if c in report.index:
+            report.loc[c, 'dtype_after'] = 'offsets+ids'
+            report.loc[c, 'bytes_after'] = nbytes
+    report['ratio'] = report['bytes_after'] / report['bytes_before']
+    return report.sort_values('bytes_before', ascending=False)
+
+
+def print_memory_report(report : pd.DataFrame, top=15):
+    total_before = report['bytes_before'].sum()
+    total_after = report['bytes_after'].sum()
+    print(report.head(top).to_string(float_format=lambda v: f"{v:.2f}"))
+    print(f"Memoria: {total_before / 1e6:.2f} MB -> {total_after / 1e6:.2f} MB ({total_after / total_before:.0%})")
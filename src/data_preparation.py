@@ -7,15 +7,16 @@
 import pandas as pd
 import os
 
+import ingestion
+import validation
+
 # Global variable for directory
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
 
 def data_concat_and_selection(dataframes : list[pd.DataFrame]):
-    f_df = pd.DataFrame()
-    # Data concatenation, this is for Primera Division
-    for dataframe in dataframes:
-        f_df = pd.concat([f_df,dataframe],ignore_index=True)
+    # Data concatenation, this is for Primera Division. A single concat, every frame is copied once
+    f_df = pd.concat(dataframes, ignore_index=True)
 
     """
     Data cleansing, filtering the useful columns. The keys for the columns are the following:
@@ -54,23 +55,21 @@ def data_transforming(dataframe : pd.DataFrame):
     Transforming the data, using dtypes we can observe that the columns Div, Date, Time, HomeTeam, AwayTeam, FTR, HTR, are objects
     """
     dataframe['Div'] = dataframe['Div'].astype('category')
-    dataframe['Date'] = pd.to_datetime(dataframe['Date'], dayfirst=True, errors='coerce')
+    # read_primera already parses the dates with the format of each season
+    if not pd.api.types.is_datetime64_any_dtype(dataframe['Date']):
+        dataframe['Date'] = pd.to_datetime(dataframe['Date'], dayfirst=True, errors='coerce')
     dataframe['FTR'] = dataframe['FTR'].astype('category')
     dataframe['HTR'] = dataframe['HTR'].astype('category')
 
     return dataframe.drop_duplicates()
 
 def read_primera():
+    """
+    Reads the seasons concurrently with the pinned columns, dtypes and date formats of ingestion.py
+    """
     path = os.path.join(base_dir, '..', 'data', 'Primera')
     path = os.path.normpath(path)
-    dataframes = []
-
-    for filename in os.listdir(path):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(path, filename)
-            df = pd.read_csv(file_path)
-
-            dataframes.append(df)
+    dataframes, _ = ingestion.read_seasons(path)
 
     return dataframes
 
@@ -129,9 +128,14 @@ def mapping_team_names(data_transformed : pd.DataFrame):
 
     return data_transformed
 
-if __name__ == "__main__":
+def main():
     dataframes_primera = read_primera()
     dataframes_concat = data_concat_and_selection(dataframes=dataframes_primera)
     data_transformed = data_transforming(dataframes_concat)
     data_transformed = mapping_team_names(data_transformed)
+    validation.check_stage(data_transformed, 'LaLiga_combined.csv')
     write_csv(data_transformed)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,13 @@ import os
 import numpy as np
 import ast
 
+import compact_schema
+import market_odds
+import match_features
+import odds_math
+import scoreline_model
+import validation
+
 # Global variable for directory
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -100,54 +107,27 @@ def add_stat_features(df : pd.DataFrame, window=7):
     return df
 
 
-def add_index_features(df : pd.DataFrame):
+def add_market_features(df : pd.DataFrame, method="proportional"):
     """
-    Various statistics, like attack strength, defense strength, discipline...
-    """
-    df["attack_strength_home"] = (
-        df["home_avg_goals_scored_7"] + 0.1 * df["home_avg_shots_on_target_7"]
-    )
-    df["attack_strength_away"] = (
-        df["away_avg_goals_scored_7"] + 0.1 * df["away_avg_shots_on_target_7"]
-    )
-    df["defense_strength_home"] = 1 / (
-        df["home_avg_goals_conceded_7"] + 0.1 * df["home_avg_yellows_7"] + 1e-3
-    )
-    df["defense_strength_away"] = 1 / (
-        df["away_avg_goals_conceded_7"] + 0.1 * df["away_avg_yellows_7"] + 1e-3
-    )
-    df["discipline_index_home"] = 1 - (
-        (0.5 * df["home_avg_yellows_7"] + 1.5 * df["home_avg_reds_7"]) / 10
-    )
-    df["discipline_index_away"] = 1 - (
-        (0.5 * df["away_avg_yellows_7"] + 1.5 * df["away_avg_reds_7"]) / 10
-    )
-    
-    return df
-
-
-def add_market_features(df : pd.DataFrame):
-    """
-    Odd marks into probabilities
+    Odd marks into probabilities, removing the bookmaker margin (proportional, power or shin)
     """
 
     cols = ["B365H", "B365D", "B365A"]
     if not all(c in df.columns for c in cols):
         print("No se encontraron todas las columnas de cuotas (B365H/D/A). Se omite esta transformación.")
         return df
-    
-    for c in cols:
-        df[f"{c}_prob"] = 1 / df[c]
 
-    sum_probs = df[[f"{c}_prob" for c in cols]].sum(axis=1)
-    for c in cols:
-        df[f"{c}_prob"] = df[f"{c}_prob"] / sum_probs
+    prob_cols = [f"{c}_prob" for c in cols]
+    probs = odds_math.devig(df[cols].to_numpy(), method)
+    for c, p in zip(prob_cols, probs.T):
+        df[c] = p
 
     df["prob_diff_home_away"] = df["B365H_prob"] - df["B365A_prob"] 
-    df["prob_fav_margin"] = df[[f"{c}_prob" for c in cols]].max(axis=1) - df[[f"{c}_prob" for c in cols]].min(axis=1)
+    df["prob_fav_margin"] = df[prob_cols].max(axis=1) - df[prob_cols].min(axis=1)
 
-    df.replace([np.inf, -np.inf], np.nan, inplace=True)
-    df.fillna(0, inplace=True)
+    # Only the odds columns are filled, the NaN of Elo and rolling stats are kept
+    market_cols = prob_cols + ["prob_diff_home_away", "prob_fav_margin"]
+    df[market_cols] = df[market_cols].replace([np.inf, -np.inf], np.nan).fillna(0)
 
     return df
 
@@ -162,10 +142,11 @@ def generate_features(df : pd.DataFrame):
     df = add_elo_features(df)
     df = add_form_features(df)
     df = add_stat_features(df)
-    df = add_index_features(df)
+    df = match_features.add_index_features(df)
     df = get_rivalidades(df)
     df = get_resultado_string(df)
     df = get_resultado_M(df)
+    df = scoreline_model.add_scoreline_features(df)
     if "B365H" in df.columns:
         df = add_market_features(df)
     
@@ -255,17 +236,7 @@ def get_season(date):
         return f"{year - 1}_{str(year)[2:]}"
 
 def get_rivalidades(df : pd.DataFrame):
-    rivalidades = []
-    path = os.path.join(base_dir,'..', 'data','raw','rivalidades.txt')
-    with open(path,'r',encoding='utf-8') as f:
-        for linea in f:
-            linea = linea.strip()
-            if not linea:
-                continue
-            linea = linea.strip("(),")
-            equipo1, equipo2 = linea.split(",",1)
-            rivalidades.append((equipo1.strip(),equipo2.strip()))
-    rivalidades_set = {frozenset(r) for r in rivalidades}
+    rivalidades_set = match_features.load_rivalidades()
     df["derby"] = (df.apply(lambda r: frozenset((r['HomeTeam'],r['AwayTeam'])) in rivalidades_set, axis=1).astype('int8'))
     return df
     
@@ -280,16 +251,38 @@ def get_resultado_M(df : pd.DataFrame):
     df['result_abstract'] = goals_home.astype(str) + '-' + goals_away.astype(str)
     return df
 
-if __name__ == "__main__":
+def main():
     path = os.path.join(base_dir, '..', 'data', 'processed','LaLiga_combined.csv')
     path = os.path.normpath(path)
     
     df = pd.read_csv(path)
     df = generate_features(df)
+    df = market_odds.add_consensus_features(df, market_odds.load_market_odds())
     df = join_with_matches(df)
     df['Date'] = pd.to_datetime(df['Date'], dayfirst=True, errors='coerce')
     df["Season"] = df["Date"].apply(get_season)
     df = merge_lineups(df)
     print(f"Different results count: {len(df['result_string'].unique())}")
     print(f"Different results abstract: {len(df['result_abstract'].unique())}")
-    df.to_csv("data/processed/laliga_features.csv", index=False)
+
+    usage = compact_schema.frame_usage(df)
+    df = compact_schema.compact_frame(df)
+    df['Home_Lineup_List'] = df['Home_Lineup_List'].apply(string_into_list)
+    df['Away_Lineup_List'] = df['Away_Lineup_List'].apply(string_into_list)
+    validation.check_stage(df, 'laliga_features.csv')
+
+    # Lineups go to the npz (offsets + ids), the CSV only keeps the compact columns
+    output_file = os.path.normpath(os.path.join(base_dir, '..', 'data', 'processed', 'laliga_features.csv'))
+    compact_schema.save_lineups(output_file.replace('.csv', '_lineups.npz'), df['Home_Lineup_List'], df['Away_Lineup_List'])
+    lineups = compact_schema.load_lineups(output_file.replace('.csv', '_lineups.npz'))
+    df = df.drop(columns=compact_schema.LINEUP_COLUMNS)
+    compact_schema.print_memory_report(compact_schema.memory_report(usage, df, {
+        'Home_Lineup_List': compact_schema.lineup_nbytes(lineups['home_offsets'], lineups['home_ids'], lineups['vocab']),
+        'Away_Lineup_List': compact_schema.lineup_nbytes(lineups['away_offsets'], lineups['away_ids']),
+    }))
+    df.to_csv(output_file, index=False)
+    print(f"Archivo guardado en {output_file}")
+
+
+if __name__ == "__main__":
+    main()
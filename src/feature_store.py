@@ -0,0 +1,408 @@
+# ==========================================================
+#  feature_store.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import compact_schema
+import feature_engineering
+import match_features
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+store_dir = os.path.normpath(os.path.join(base_dir, '..', 'data', 'feature_store'))
+
+# Columns known only after the match. They are never written to the store as features, so a
+# pre-match lookup can't leak the result even when it includes the matches played on the same
+# date. The post-match state (post_*) is derived from them and only served for later dates.
+POST_MATCH_COLUMNS = {
+    'FTHG', 'FTAG', 'FTR', 'HTHG', 'HTAG', 'HTR', 'HS', 'AS', 'HST', 'AST', 'HF', 'AF',
+    'HC', 'AC', 'HY', 'AY', 'HR', 'AR', 'result_string', 'result_abstract',
+}
+KEY_COLUMNS = {'Div', 'Date', 'HomeTeam', 'AwayTeam', 'Season', 'home_team_norm', 'away_team_norm',
+               'Home_Lineup_List', 'Away_Lineup_List'}
+
+
+# Columns with the side in the outcome letter instead of a home/away token: (side, neutral name)
+SIDE_COLUMNS = {
+    'B365H': ('home', 'B365_win'), 'B365A': ('away', 'B365_win'),
+    'B365H_prob': ('home', 'B365_win_prob'), 'B365A_prob': ('away', 'B365_win_prob'),
+}
+# Match-level home minus away columns, which change sign from the away team's point of view
+ANTISYMMETRIC_COLUMNS = {'prob_diff_home_away', 'team_value_diff'}
+# Home/away ratios with no away-team equivalent in the table, left out of the store
+EXCLUDED_COLUMNS = {'team_value_ratio'}
+# Dixon-Coles scoreline probabilities dc_prob_<home goals>_<away goals>
+SCORELINE_PREFIX = 'dc_prob_'
+GOALS = {'0', '1', '2', 'M'}
+
+
+def side_of(column : str):
+    """
+    'home' or 'away' when the column belongs to one of the teams (elo_home, home_avg_shots_7, B365H...),
+    None for match-level columns (elo_diff, prob_diff_home_away, derby...)
+    """
+    if column in SIDE_COLUMNS:
+        return SIDE_COLUMNS[column][0]
+    tokens = set(column.split('_'))
+    sides = tokens & {'home', 'away'}
+    return sides.pop() if len(sides) == 1 else None
+
+
+def neutral_name(column : str):
+    """home_avg_shots_7 -> avg_shots_7, elo_home -> elo, B365H_prob -> B365_win_prob"""
+    if column in SIDE_COLUMNS:
+        return SIDE_COLUMNS[column][1]
+    return '_'.join(t for t in column.split('_') if t not in ('home', 'away'))
+
+
+def scoreline_goals(column : str):
+    """dc_prob_2_M -> ('2', 'M'), None for the other columns"""
+    goals = column[len(SCORELINE_PREFIX):].split('_') if column.startswith(SCORELINE_PREFIX) else []
+    return tuple(goals) if len(goals) == 2 and set(goals) <= GOALS else None
+
+
+def team_view(df : pd.DataFrame, column : str, side : str):
+    """
+    (name, values) of a match-level column from the point of view of the team playing on side:
+    scorelines as own-rival goals and home minus away differences with the sign of the team
+    """
+    goals = scoreline_goals(column)
+    if goals is not None and side == 'away':
+        swapped = f"{SCORELINE_PREFIX}{goals[1]}_{goals[0]}"
+        return column, df[swapped].to_numpy(dtype=np.float32)
+    if column in ANTISYMMETRIC_COLUMNS:
+        sign = 1 if side == 'home' else -1
+        return neutral_name(column), sign * df[column].to_numpy(dtype=np.float32)
+    return column, df[column].to_numpy(dtype=np.float32)
+
+
+def feature_columns(df : pd.DataFrame):
+    return [
+        c for c in df.columns
+        if c not in POST_MATCH_COLUMNS and c not in KEY_COLUMNS and c not in EXCLUDED_COLUMNS
+        and pd.api.types.is_numeric_dtype(df[c])
+    ]
+
+
+def team_rows(df : pd.DataFrame, teams : list[str]):
+    """
+    Long format with one row per (team, match) and the features from the team's point of view:
+    own columns keep the neutral name, the rival's ones get the prefix opp_ and the asymmetric
+    match-level columns are oriented with team_view
+    """
+    team_id = {t: i for i, t in enumerate(teams)}
+    columns = feature_columns(df)
+    dates = pd.to_datetime(df['Date'], errors='coerce').to_numpy().astype('datetime64[D]')
+
+    frames = []
+    for side, rival in (('home', 'away'), ('away', 'home')):
+        own_team = 'HomeTeam' if side == 'home' else 'AwayTeam'
+        rival_team = 'AwayTeam' if side == 'home' else 'HomeTeam'
+        out = {
+            'team_id': df[own_team].map(team_id).to_numpy(dtype=np.int16),
+            'date': dates.astype(np.int64),
+            'opponent_id': df[rival_team].map(team_id).to_numpy(dtype=np.int16),
+            'is_home': np.full(len(df), side == 'home', dtype=np.int8),
+        }
+        for c in columns:
+            col_side = side_of(c)
+            if col_side is None:
+                name, values = team_view(df, c, side)
+                out[name] = values
+            elif col_side == side:
+                out[neutral_name(c)] = df[c].to_numpy(dtype=np.float32)
+            else:
+                out['opp_' + neutral_name(c)] = df[c].to_numpy(dtype=np.float32)
+        frames.append(pd.DataFrame(out))
+
+    rows = pd.concat(frames, ignore_index=True)
+    return rows.sort_values(['team_id', 'date'], kind='mergesort').reset_index(drop=True)
+
+
+def window_means(long : pd.DataFrame, rows : pd.Series, column : str, window=match_features.FORM_WINDOW):
+    """
+    Mean of the last `window` values of column over the selected rows of each team, including
+    the current one (NaN until the team has `window` of them), on the rows of long
+    """
+    selected = long[rows]
+    means = selected.groupby('team_id')[column].rolling(window).mean().reset_index(level=0, drop=True)
+    return means.reindex(long.index)
+
+
+def post_match_state(df : pd.DataFrame, teams : list[str]):
+    """
+    State of the team after each of its matches, the one its next match starts from: Elo after
+    the update of add_elo_features, rolling stats of its last home and away matches, last known
+    squad value and market H/D/A of its last home and away matches with odds. One row per
+    (team_id, date); fixtures without result carry the state of the previous match.
+    """
+    team_id = {t: i for i, t in enumerate(teams)}
+    dates = df['Date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    played = (df['FTHG'].notna() & df['FTAG'].notna()).to_numpy()
+    exp_home = 1 / (1 + 10 ** ((df['elo_away'] - df['elo_home']) / 400))
+    score_home = np.sign(df['FTHG'] - df['FTAG']) * 0.5 + 0.5
+    has_odds = (df[match_features.MARKET_COLUMNS] > 0).all(axis=1).to_numpy() \
+        if all(c in df.columns for c in match_features.MARKET_COLUMNS) else np.zeros(len(df), dtype=bool)
+
+    frames = []
+    for side in ('home', 'away'):
+        own_team = 'HomeTeam' if side == 'home' else 'AwayTeam'
+        stats = match_features.HOME_STATS if side == 'home' else match_features.AWAY_STATS
+        score = score_home if side == 'home' else 1 - score_home
+        expected = exp_home if side == 'home' else 1 - exp_home
+        out = {
+            'team_id': df[own_team].map(team_id).to_numpy(dtype=np.int16),
+            'date': dates,
+            'is_home': np.full(len(df), side == 'home'),
+            'played': played,
+            'post_elo': (df[f'elo_{side}'] + match_features.ELO_K * (score - expected)).to_numpy(dtype=np.float64),
+            'post_value': df[f'{side}_team_value'].to_numpy(dtype=np.float64)
+            if f'{side}_team_value' in df.columns else np.full(len(df), np.nan),
+        }
+        for col, feature in stats:
+            out[f'source_{feature}'] = df[col].to_numpy(dtype=np.float64) if col in df.columns else np.nan
+        for outcome, col in zip('HDA', match_features.MARKET_COLUMNS):
+            market = df[col].to_numpy(dtype=np.float64) if col in df.columns else np.full(len(df), np.nan)
+            out[f'post_{side}_market_{outcome}'] = np.where(has_odds, market, np.nan)
+        frames.append(pd.DataFrame(out))
+
+    long = pd.concat(frames, ignore_index=True).sort_values(['team_id', 'date'], kind='mergesort')
+    long = long.reset_index(drop=True)
+    long.loc[~long['played'], 'post_elo'] = np.nan
+    long['post_value'] = long['post_value'].where(long['post_value'] > 0)
+    for side, stats in (('home', match_features.HOME_STATS), ('away', match_features.AWAY_STATS)):
+        rows = long['played'] & (long['is_home'] == (side == 'home'))
+        for _, feature in stats:
+            if f'post_{feature}' not in long.columns:
+                long[f'post_{feature}'] = window_means(long, rows, f'source_{feature}')
+
+    state = [c for c in long.columns if c.startswith('post_')]
+    long[state] = long.groupby('team_id')[state].ffill()
+    return long[['team_id', 'date'] + state]
+
+
+def build_store(df : pd.DataFrame, path=store_dir):
+    """
+    Writes the store: one folder per season with a .npy file per column, rows sorted by (team_id, date).
+    Each row has the pre-match features of the match and the post-match state of the team (post_*).
+    """
+    df = df.copy()
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    if 'Season' not in df.columns:
+        df['Season'] = df['Date'].apply(feature_engineering.get_season)
+    df = df.dropna(subset=['Date'])
+
+    teams = sorted(pd.concat([df['HomeTeam'], df['AwayTeam']]).unique())
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    df = df.sort_values('Date', kind='mergesort')
+    state = post_match_state(df, teams)
+    seasons = sorted(df['Season'].unique())
+    columns = []
+    for season in seasons:
+        rows = team_rows(df[df['Season'] == season], teams)
+        rows = rows.merge(state, on=['team_id', 'date'], how='left')
+        columns = list(rows.columns)
+        partition = os.path.join(path, f"season={season}")
+        os.makedirs(partition)
+        for c in columns:
+            np.save(os.path.join(partition, f"{c}.npy"), np.ascontiguousarray(rows[c].to_numpy()))
+
+    meta = {'teams': teams, 'seasons': seasons, 'columns': columns,
+            'state_columns': [c for c in columns if c.startswith('post_')]}
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"Feature store guardado en {path} ({len(seasons)} temporadas, {len(columns)} columnas)")
+    return path
+
+
+def open_store(path=store_dir):
+    """
+    Memory-maps every column of every season. Only the (team_id, date) index is read into memory:
+    a global key sorted by team and date with the partition and row of each entry.
+    """
+    with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+
+    partitions = []
+    for season in meta['seasons']:
+        partition = os.path.join(path, f"season={season}")
+        partitions.append({
+            c: np.load(os.path.join(partition, f"{c}.npy"), mmap_mode='r') for c in meta['columns']
+        })
+
+    keys = np.concatenate([
+        (p['team_id'].astype(np.int64) << 32) + (p['date'].astype(np.int64) + (1 << 31)) for p in partitions
+    ])
+    part = np.concatenate([np.full(len(p['team_id']), i, dtype=np.int32) for i, p in enumerate(partitions)])
+    row = np.concatenate([np.arange(len(p['team_id']), dtype=np.int64) for p in partitions])
+    order = np.argsort(keys, kind='stable')
+
+    return {
+        'meta': meta,
+        'team_id': {t: i for i, t in enumerate(meta['teams'])},
+        'partitions': partitions,
+        'keys': keys[order],
+        'part': part[order],
+        'row': row[order],
+    }
+
+
+def lookup_positions(store : dict, team_ids : np.ndarray, dates : np.ndarray, inclusive=True):
+    """
+    Position in the global index of the last row of each team with date <= D (< D if not inclusive).
+    -1 when the team has no row before D.
+    """
+    days = dates.astype('datetime64[D]').astype(np.int64)
+    if not inclusive:
+        days = days - 1
+    query = (team_ids.astype(np.int64) << 32) + (days + (1 << 31))
+    pos = np.searchsorted(store['keys'], query, side='right') - 1
+    valid = (pos >= 0) & (team_ids >= 0)
+    pos = np.where(valid, pos, 0)
+    valid &= (store['keys'][pos] >> 32) == team_ids
+    return np.where(valid, pos, -1)
+
+
+def gather(store : dict, positions : np.ndarray, columns : list[str]):
+    """
+    Reads the rows at the given index positions, partition by partition, from the memory-mapped columns
+    """
+    found = positions >= 0
+    out = {c: np.full(len(positions), np.nan, dtype=np.float64) for c in columns}
+    part = store['part'][positions[found]]
+    row = store['row'][positions[found]]
+    where = np.flatnonzero(found)
+    for p in np.unique(part):
+        sel = part == p
+        rows = row[sel]
+        for c in columns:
+            out[c][where[sel]] = store['partitions'][p][c][rows]
+    return out
+
+
+def team_states(store : dict, team_ids : np.ndarray, dates : np.ndarray):
+    """
+    Post-match state of every team after its last match strictly before each date, the state a
+    match on that date starts from. Returns the post_* columns and the date of that last match.
+    """
+    positions = lookup_positions(store, team_ids, dates, inclusive=False)
+    values = gather(store, positions, store['meta']['state_columns'] + ['date'])
+    values['found'] = positions >= 0
+    return values
+
+
+def as_of(store : dict, team : str, date):
+    """
+    State of team as of date: after its last match before date (Elo, rolling stats and value
+    updated with that match), the same state predict.py scores the next fixture with
+    """
+    team_ids = np.array([store['team_id'].get(team, -1)], dtype=np.int64)
+    values = team_states(store, team_ids, np.array([np.datetime64(str(date)[:10], 'D')]))
+    result = {c[len('post_'):]: float(values[c][0]) for c in store['meta']['state_columns']}
+    result['as_of_date'] = str(np.datetime64(int(values['date'][0]), 'D')) if values['found'][0] else None
+    return result
+
+
+def team_snapshot(store : dict, as_of=None):
+    """
+    State of every team that played before as_of (all the matches when None) as the arrays of
+    the predict.py snapshot
+    """
+    teams = np.array(store['meta']['teams'], dtype=str)
+    last = (store['keys'] & 0xFFFFFFFF) - (1 << 31)
+    date = np.datetime64(str(as_of)[:10], 'D') if as_of is not None else np.datetime64(int(last.max()) + 1, 'D')
+    values = team_states(store, np.arange(len(teams)), np.full(len(teams), date))
+    found = values['found']
+
+    def columns(names):
+        return np.column_stack([values[f'post_{n}'][found] for n in names])
+
+    return {
+        "teams": teams[found],
+        "elo": values['post_elo'][found],
+        "value": values['post_value'][found],
+        "home_stats": columns([f for _, f in match_features.HOME_STATS]),
+        "away_stats": columns([f for _, f in match_features.AWAY_STATS]),
+        "home_market": columns([f'home_market_{o}' for o in 'HDA']),
+        "away_market": columns([f'away_market_{o}' for o in 'HDA']),
+        "last_date": np.array(str(np.datetime64(int(values['date'][found].max()), 'D'))),
+    }
+
+
+def last_pre_match(store : dict, team : str, date, columns=None, inclusive=True):
+    """
+    Pre-match features of the last match of team on or before date (the inputs of that match,
+    without its result). as_of gives the state after it.
+    """
+    if columns is None:
+        columns = [c for c in store['meta']['columns']
+                   if c not in ('team_id', 'date') and c not in store['meta']['state_columns']]
+    result = point_in_time_join(store, pd.DataFrame({'team': [team], 'date': [date]}), 'team', 'date',
+                                columns, inclusive=inclusive)
+    return result.iloc[0].to_dict()
+
+
+def point_in_time_join(store : dict, keys : pd.DataFrame, team_col : str, date_col : str, columns=None,
+                       prefix='', inclusive=True):
+    """
+    Bulk as-of join: for every (team, date) of keys, the store row of that team with the latest
+    date <= date, i.e. the pre-match features of that match (see last_pre_match). Returns a frame aligned with keys. Unknown teams and dates before the first
+    match of the team give NaN.
+    """
+    if columns is None:
+        columns = [c for c in store['meta']['columns']
+                   if c not in ('team_id', 'date') and c not in store['meta']['state_columns']]
+    team_ids = keys[team_col].map(store['team_id']).fillna(-1).to_numpy(dtype=np.int64)
+    dates = pd.to_datetime(keys[date_col], errors='coerce').to_numpy()
+    positions = lookup_positions(store, team_ids, dates, inclusive)
+
+    values = gather(store, positions, columns + ['date'])
+    out = pd.DataFrame({f"{prefix}{c}": values[c] for c in columns}, index=keys.index)
+    out[f"{prefix}as_of_date"] = pd.to_datetime(
+        np.where(positions >= 0, values['date'], np.nan).astype('float64'), unit='D'
+    )
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Point-in-time feature store")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="Builds the store from laliga_features.csv")
+    p_build.add_argument("--features", default=None, help="Path to laliga_features.csv")
+
+    p_lookup = sub.add_parser("lookup", help="State of a team as of a date (after its last match before it)")
+    p_lookup.add_argument("team")
+    p_lookup.add_argument("date")
+    p_lookup.add_argument("--pre-match", action="store_true",
+                          help="Pre-match features of the last match on or before the date instead")
+    p_lookup.add_argument("--strict", action="store_true", help="With --pre-match, excludes matches played on the date")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        path = args.features or os.path.join(base_dir, '..', 'data', 'processed', 'laliga_features.csv')
+        build_store(compact_schema.read_features(path))
+    elif args.command == "lookup":
+        store = open_store()
+        if args.pre_match:
+            values = last_pre_match(store, args.team, args.date, inclusive=not args.strict)
+        else:
+            values = as_of(store, args.team, args.date)
+        for k, v in values.items():
+            print(f"{k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -115,5 +115,9 @@ def scrape_all_seasons():
         scrape_la_liga(output_filename, teams)
 
 
-if __name__ == "__main__":
+def main():
     df = scrape_all_seasons()
+
+
+if __name__ == "__main__":
+    main()
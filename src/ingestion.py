@@ -0,0 +1,146 @@
+# ==========================================================
+#  ingestion.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+primera_dir = os.path.normpath(os.path.join(base_dir, '..', 'data', 'Primera'))
+
+# Pinned schema of the football-data columns used by the pipeline (see data_concat_and_selection).
+# Counts are nullable integers so a missing result is reported instead of turning the column into float.
+SCHEMA = {
+    'Div': 'category',
+    'HomeTeam': 'str',
+    'AwayTeam': 'str',
+    'FTHG': 'Int16',
+    'FTAG': 'Int16',
+    'FTR': 'category',
+    'HTHG': 'Int16',
+    'HTAG': 'Int16',
+    'HTR': 'category',
+    'HS': 'Int16',
+    'AS': 'Int16',
+    'HST': 'Int16',
+    'AST': 'Int16',
+    'HF': 'Int16',
+    'AF': 'Int16',
+    'HC': 'Int16',
+    'AC': 'Int16',
+    'HY': 'Int16',
+    'AY': 'Int16',
+    'HR': 'Int16',
+    'AR': 'Int16',
+    'B365H': 'float64',
+    'B365D': 'float64',
+    'B365A': 'float64',
+}
+COLUMNS = ['Div', 'Date'] + [c for c in SCHEMA if c != 'Div']
+RESULT_COLUMNS = ['FTHG', 'FTAG', 'FTR']
+
+# football-data switched from 2-digit to 4-digit years in 2018-19
+FOUR_DIGIT_YEAR_FROM = 2018
+
+
+def season_start_year(filename : str):
+    """'LaLiga 05-06.csv' -> 2005"""
+    match = re.search(r'(\d{2})-(\d{2})', filename)
+    if not match:
+        raise ValueError(f"Can't read the season of {filename}")
+    return 2000 + int(match.group(1))
+
+
+def date_format(filename : str):
+    return '%d/%m/%Y' if season_start_year(filename) >= FOUR_DIGIT_YEAR_FROM else '%d/%m/%y'
+
+
+def read_season_file(file_path : str, columns=COLUMNS):
+    """
+    Reads one season with the pinned columns, dtypes and date format. Returns the frame and its load time.
+    """
+    start = time.perf_counter()
+    filename = os.path.basename(file_path)
+    header = pd.read_csv(file_path, nrows=0, encoding='utf-8-sig').columns
+    missing = [c for c in columns if c not in header]
+    usecols = [c for c in columns if c in header]
+
+    df = pd.read_csv(
+        file_path,
+        usecols=usecols,
+        dtype={c: t for c, t in SCHEMA.items() if c in usecols},
+        encoding='utf-8-sig',
+    )
+    df['Date'] = pd.to_datetime(df['Date'], format=date_format(filename), errors='coerce')
+    df = df[usecols]
+    return df, {'file': filename, 'rows': len(df), 'seconds': time.perf_counter() - start, 'missing_columns': missing}
+
+
+def validate(df : pd.DataFrame, report : dict):
+    """
+    Early checks of one season: dates that don't match the era format, matches without result
+    and duplicated matches
+    """
+    issues = []
+    if report['missing_columns']:
+        issues.append(f"missing columns {report['missing_columns']}")
+    bad_dates = int(df['Date'].isna().sum())
+    if bad_dates:
+        issues.append(f"{bad_dates} unparsed dates")
+    results = [c for c in RESULT_COLUMNS if c in df.columns]
+    no_result = int(df[results].isna().any(axis=1).sum())
+    if no_result:
+        issues.append(f"{no_result} matches without result")
+    duplicated = int(df.duplicated(subset=['Date', 'HomeTeam', 'AwayTeam']).sum())
+    if duplicated:
+        issues.append(f"{duplicated} duplicated matches")
+    report['issues'] = issues
+    return report
+
+
+def read_seasons(path=primera_dir, columns=COLUMNS, max_workers=None, strict=False, verbose=True):
+    """
+    Reads every season CSV concurrently, in season order, and validates each one.
+    Returns the frames and the per-file reports; strict=True raises if any file has issues.
+    """
+    files = sorted(f for f in os.listdir(path) if f.endswith('.csv'))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        loaded = list(pool.map(lambda f: read_season_file(os.path.join(path, f), columns), files))
+    elapsed = time.perf_counter() - start
+
+    frames = [df for df, _ in loaded]
+    reports = [validate(df, report) for df, report in loaded]
+    if verbose:
+        for r in reports:
+            status = '; '.join(r['issues']) if r['issues'] else 'ok'
+            print(f"  {r['file']:<22} {r['rows']:>4} filas {r['seconds'] * 1000:7.1f} ms  {status}")
+        print(f"{len(files)} ficheros, {sum(r['rows'] for r in reports)} partidos en {elapsed * 1000:.1f} ms")
+
+    failed = [r for r in reports if r['issues']]
+    if strict and failed:
+        raise ValueError("Ingestion issues: " + "; ".join(f"{r['file']}: {', '.join(r['issues'])}" for r in failed))
+    return frames, reports
+
+
+def load_seasons(path=primera_dir, columns=COLUMNS, max_workers=None, strict=False, verbose=True):
+    """
+    All the seasons in one frame with a single concat. Matches repeated across files are also reported.
+    """
+    frames, reports = read_seasons(path, columns, max_workers, strict, verbose)
+    df = pd.concat(frames, ignore_index=True)
+    duplicated = int(df.duplicated(subset=['Date', 'HomeTeam', 'AwayTeam']).sum())
+    if duplicated and verbose:
+        print(f"{duplicated} partidos duplicados entre ficheros")
+    return df, reports
+
+
+if __name__ == "__main__":
+    load_seasons(strict=True)
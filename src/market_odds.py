@@ -0,0 +1,211 @@
+# ==========================================================
+#  market_odds.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import data_preparation
+import ingestion
+import odds_math
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+METHODS = odds_math.METHODS
+KEY_COLUMNS = ['Div', 'Date', 'HomeTeam', 'AwayTeam', 'FTR', 'FTHG', 'FTAG']
+# Aggregated columns of football-data (max and average over the bookmakers), not bookmakers themselves
+AGGREGATES = {'Max', 'Avg', 'BbMx', 'BbAv', 'MaxC', 'AvgC'}
+# Bookmaker counts of the Betbrain era
+COUNT_COLUMNS = {'Bb1X2', 'BbOU', 'BbAH'}
+
+
+def odds_columns(columns):
+    """
+    Odds columns of a football-data CSV:
+    1x2 : {book: (H, D, A)} for every prefix with the three outcomes (B365, PS, B365C closing, Max, BbAv...)
+    ou  : {book: (over 2.5, under 2.5)}
+    ah  : Asian handicap lines and odds
+    """
+    columns = list(columns)
+    present = set(columns)
+    result = {'1x2': {}, 'ou': {}, 'ah': []}
+
+    for c in columns:
+        if c.endswith('H') and c not in COUNT_COLUMNS:
+            book = c[:-1]
+            if book and f"{book}D" in present and f"{book}A" in present and 'AH' not in book:
+                result['1x2'][book] = (c, f"{book}D", f"{book}A")
+        if c.endswith('>2.5'):
+            book = c[:-len('>2.5')]
+            if f"{book}<2.5" in present:
+                result['ou'][book] = (c, f"{book}<2.5")
+        elif 'AH' in c and c not in COUNT_COLUMNS:
+            result['ah'].append(c)
+    return result
+
+
+def all_odds_columns(columns):
+    groups = odds_columns(columns)
+    cols = [c for triplet in groups['1x2'].values() for c in triplet]
+    cols += [c for pair in groups['ou'].values() for c in pair]
+    return cols + groups['ah']
+
+
+def read_odds_file(file_path : str):
+    header = pd.read_csv(file_path, nrows=0, encoding='utf-8-sig').columns
+    usecols = [c for c in KEY_COLUMNS if c in header] + all_odds_columns(header)
+    df = pd.read_csv(file_path, usecols=usecols, encoding='utf-8-sig')
+    df['Date'] = pd.to_datetime(df['Date'], format=ingestion.date_format(os.path.basename(file_path)), errors='coerce')
+    return df
+
+
+def load_market_odds():
+    """
+    Every bookmaker, max/avg, over/under and Asian handicap column of the data/Primera CSVs,
+    with the team names and dates of LaLiga_combined.csv
+    """
+    path = os.path.normpath(os.path.join(base_dir, '..', 'data', 'Primera'))
+    frames = [
+        read_odds_file(os.path.join(path, filename))
+        for filename in sorted(os.listdir(path)) if filename.endswith('.csv')
+    ]
+    odds = pd.concat(frames, ignore_index=True)
+    odds = data_preparation.mapping_team_names(odds)
+    return odds.dropna(subset=['Date']).drop_duplicates(subset=['Date', 'HomeTeam', 'AwayTeam'])
+
+
+def is_closing(book : str, books : dict):
+    """B365C, PSC, VCC... are the closing odds of B365, PS, VC (VC itself is a bookmaker)"""
+    return book.endswith('C') and book[:-1] in books
+
+
+def nan_mean(values : np.ndarray, axis : int):
+    """
+    Mean ignoring NaN, NaN (without warnings) when every value is missing
+    """
+    count = (~np.isnan(values)).sum(axis=axis)
+    total = np.where(np.isnan(values), 0, values).sum(axis=axis)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def stacked_odds(df : pd.DataFrame, groups : dict):
+    """
+    (rows, books, outcomes) array with the odds of every bookmaker
+    """
+    return np.stack([df[list(cols)].to_numpy(dtype=np.float64) for cols in groups.values()], axis=1)
+
+
+def average_books(groups : dict, closing : bool):
+    """Market average columns (Avg, AvgC, BbAv) of a group of odds columns"""
+    return {
+        b: cols for b, cols in groups.items()
+        if b in ('Avg', 'AvgC', 'BbAv') and is_closing(b, groups) == closing
+    }
+
+
+def fill_column(out : pd.DataFrame, column : str, values : np.ndarray):
+    """Fills the NaN of column with values, or creates it when missing"""
+    values = pd.Series(values, index=out.index)
+    out[column] = out[column].fillna(values) if column in out.columns else values
+
+
+def consensus_probabilities(df : pd.DataFrame, method="proportional", closing=False):
+    """
+    Consensus probabilities: every bookmaker de-vigged with the same method and averaged.
+    Aggregated columns (Max/Avg) are left out; closing=True uses the closing odds (B365C, PSC...).
+    Matches without any single bookmaker take the de-vigged market average.
+    """
+    groups = odds_columns(df.columns)
+    books = {
+        b: cols for b, cols in groups['1x2'].items()
+        if b not in AGGREGATES and is_closing(b, groups['1x2']) == closing
+    }
+    out = pd.DataFrame(index=df.index)
+    if books:
+        odds = stacked_odds(df, books)
+        probs = odds_math.devig(odds, method)
+        out["market_prob_home"], out["market_prob_draw"], out["market_prob_away"] = nan_mean(probs, axis=1).T
+        out["market_overround"] = nan_mean(odds_math.overround(odds), axis=1)
+        out["market_n_books"] = (~np.isnan(probs[..., 0])).sum(axis=1).astype('int8')
+
+    # Seasons or matches without single bookmakers only have the market average
+    averages = average_books(groups['1x2'], closing)
+    if averages:
+        odds = stacked_odds(df, averages)
+        for column, values in zip(["market_prob_home", "market_prob_draw", "market_prob_away"],
+                                  nan_mean(odds_math.devig(odds, method), axis=1).T):
+            fill_column(out, column, values)
+        fill_column(out, "market_overround", nan_mean(odds_math.overround(odds), axis=1))
+        if "market_n_books" not in out.columns:
+            out["market_n_books"] = np.zeros(len(out), dtype='int8')
+
+    ou_books = {
+        b: cols for b, cols in groups['ou'].items()
+        if b not in AGGREGATES and is_closing(b, groups['ou']) == closing
+    }
+    if ou_books:
+        out["market_prob_over25"] = nan_mean(odds_math.devig(stacked_odds(df, ou_books), method)[..., 0], axis=1)
+
+    averages = average_books(groups['ou'], closing)
+    if averages:
+        fill_column(out, "market_prob_over25", nan_mean(odds_math.devig(stacked_odds(df, averages), method)[..., 0], axis=1))
+    return out
+
+
+def add_consensus_features(features : pd.DataFrame, odds : pd.DataFrame, method="proportional"):
+    """
+    Joins the consensus probabilities to the features by (Date, HomeTeam, AwayTeam).
+    Only the new market columns get NaN handling.
+    """
+    consensus = consensus_probabilities(odds, method)
+    consensus[['Date', 'HomeTeam', 'AwayTeam']] = odds[['Date', 'HomeTeam', 'AwayTeam']]
+    dates = pd.to_datetime(features['Date'], errors='coerce')
+    keys = pd.DataFrame({'Date': dates, 'HomeTeam': features['HomeTeam'], 'AwayTeam': features['AwayTeam']})
+    merged = keys.merge(consensus, on=['Date', 'HomeTeam', 'AwayTeam'], how='left')
+    for c in consensus.columns.drop(['Date', 'HomeTeam', 'AwayTeam']):
+        features[c] = merged[c].to_numpy()
+    return features
+
+
+def write_csv(dataframe : pd.DataFrame):
+    processed_folder = os.path.join(base_dir, '..', 'data', 'processed')
+    os.makedirs(processed_folder, exist_ok=True)
+    output_file = os.path.join(processed_folder, 'LaLiga_odds.csv')
+    dataframe.to_csv(output_file, index=False)
+    print(f"Archivo guardado en {output_file}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-bookmaker odds and overround removal")
+    parser.add_argument("--methods", nargs='+', choices=METHODS, default=list(METHODS),
+                        help="De-vig methods to compare")
+    parser.add_argument("--closing", action="store_true", help="Uses the closing odds (B365C, PSC...)")
+    parser.add_argument("--no-write", action="store_true", help="Doesn't write LaLiga_odds.csv")
+    args = parser.parse_args(argv)
+
+    odds = load_market_odds()
+    if not args.no_write:
+        write_csv(odds)
+
+    # Log loss of each method against the real result (FTR)
+    outcome = odds['FTR'].map({'H': 0, 'D': 1, 'A': 2})
+    for method in args.methods:
+        probs = consensus_probabilities(odds, method, args.closing)
+        if "market_prob_home" not in probs.columns:
+            print(f"{method:>12}: sin cuotas 1X2")
+            continue
+        p = probs[["market_prob_home", "market_prob_draw", "market_prob_away"]].to_numpy()
+        ok = outcome.notna().to_numpy() & ~np.isnan(p).any(axis=1)
+        chosen = p[ok, outcome[ok].astype(int).to_numpy()]
+        print(f"{method:>12}: log loss {-np.log(chosen).mean():.4f} ({ok.sum()} partidos)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# ==========================================================
+#  match_features.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+#
+#  Per-match formulas without pandas, shared by the feature stages (on DataFrames) and
+#  predict.py (on dicts of numpy arrays), so serving doesn't import the stages.
+
+import os
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+ELO_K = 20
+FORM_WINDOW = 7
+# Rolling stats of each team in its home matches and in its away matches: (source column, feature)
+HOME_STATS = [
+    ("FTHG", "home_avg_goals_scored_7"),
+    ("FTAG", "home_avg_goals_conceded_7"),
+    ("HS", "home_avg_shots_7"),
+    ("HST", "home_avg_shots_on_target_7"),
+    ("HC", "home_avg_corners_7"),
+    ("HF", "home_avg_fouls_7"),
+    ("HY", "home_avg_yellows_7"),
+    ("HR", "home_avg_reds_7"),
+]
+AWAY_STATS = [
+    ("FTAG", "away_avg_goals_scored_7"),
+    ("FTHG", "away_avg_goals_conceded_7"),
+    ("AS", "away_avg_shots_7"),
+    ("AST", "away_avg_shots_on_target_7"),
+    ("AC", "away_avg_corners_7"),
+    ("AF", "away_avg_fouls_7"),
+    ("AY", "away_avg_yellows_7"),
+    ("AR", "away_avg_reds_7"),
+]
+MARKET_COLUMNS = ["B365H_prob", "B365D_prob", "B365A_prob"]
+
+
+def add_index_features(df):
+    """
+    Various statistics, like attack strength, defense strength, discipline...
+    """
+    df["attack_strength_home"] = (
+        df["home_avg_goals_scored_7"] + 0.1 * df["home_avg_shots_on_target_7"]
+    )
+    df["attack_strength_away"] = (
+        df["away_avg_goals_scored_7"] + 0.1 * df["away_avg_shots_on_target_7"]
+    )
+    df["defense_strength_home"] = 1 / (
+        df["home_avg_goals_conceded_7"] + 0.1 * df["home_avg_yellows_7"] + 1e-3
+    )
+    df["defense_strength_away"] = 1 / (
+        df["away_avg_goals_conceded_7"] + 0.1 * df["away_avg_yellows_7"] + 1e-3
+    )
+    df["discipline_index_home"] = 1 - (
+        (0.5 * df["home_avg_yellows_7"] + 1.5 * df["home_avg_reds_7"]) / 10
+    )
+    df["discipline_index_away"] = 1 - (
+        (0.5 * df["away_avg_yellows_7"] + 1.5 * df["away_avg_reds_7"]) / 10
+    )
+    
+    return df
+
+
+def add_various_features(df):
+    """
+    Various features, like team values diffs and statistic-related variables
+    """
+    df["team_value_diff"] = df["home_team_value"] - df["away_team_value"]
+    df["team_value_ratio"] = df["home_team_value"] / (df["away_team_value"] + 1)
+
+    df["shots_on_target_ratio_home"] = (df["home_avg_shots_on_target_7"] / (df["home_avg_shots_7"] + 1e-5))
+    df["shots_on_target_ratio_away"] = (df["away_avg_shots_on_target_7"] / (df["away_avg_shots_7"] + 1e-5))
+
+    df["attack_vs_defense_home"] = df["attack_strength_home"] - df["defense_strength_away"]
+    df["attack_vs_defense_away"] = df["attack_strength_away"] - df["defense_strength_home"]
+
+    df["total_avg_goals"] = (df["home_avg_goals_scored_7"] + df["away_avg_goals_scored_7"])
+
+    return df
+
+
+def load_rivalidades():
+    rivalidades = []
+    path = os.path.join(base_dir,'..', 'data','raw','rivalidades.txt')
+    with open(path,'r',encoding='utf-8') as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            linea = linea.strip("(),")
+            equipo1, equipo2 = linea.split(",",1)
+            rivalidades.append((equipo1.strip(),equipo2.strip()))
+    return {frozenset(r) for r in rivalidades}
@@ -0,0 +1,86 @@
+# ==========================================================
+#  odds_math.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+#
+#  Overround removal on numpy arrays of decimal odds, without pandas, so predict.py
+#  applies the same de-vig as the feature stages.
+
+import numpy as np
+
+METHODS = ("proportional", "power", "shin")
+
+
+def implied(odds : np.ndarray):
+    """
+    Raw implied probabilities 1/odds, NaN for missing or invalid odds (<= 1)
+    """
+    odds = np.asarray(odds, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(odds > 1, 1 / odds, np.nan)
+
+
+def devig_proportional(pi : np.ndarray):
+    return pi / pi.sum(axis=-1, keepdims=True)
+
+
+def devig_power(pi : np.ndarray, iterations=30):
+    """
+    p_i = pi_i ** k with k such that sum(p) = 1. Newton on all the rows at once: f(k) is convex
+    and decreasing, so starting at k = 1 the iterates increase monotonically to the root.
+    """
+    log_pi = np.log(pi)
+    k = np.ones(pi.shape[:-1] + (1,))
+    for _ in range(iterations):
+        p = np.exp(k * log_pi)
+        f = p.sum(axis=-1, keepdims=True) - 1
+        df = (p * log_pi).sum(axis=-1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = np.where(np.abs(f) > 1e-12, f / df, 0)
+        k = k - step
+    return np.exp(k * log_pi)
+
+
+def shin_probs(pi : np.ndarray, total : np.ndarray, z : np.ndarray):
+    return (np.sqrt(z ** 2 + 4 * (1 - z) * pi ** 2 / total) - z) / (2 * (1 - z))
+
+
+def devig_shin(pi : np.ndarray, iterations=60):
+    """
+    Shin's model: insider proportion z such that the probabilities sum 1.
+    The sum decreases with z, so all the rows are solved together by bisection on [0, 0.5].
+    """
+    total = pi.sum(axis=-1, keepdims=True)
+    lo = np.zeros(total.shape)
+    hi = np.full(total.shape, 0.5)
+    for _ in range(iterations):
+        z = (lo + hi) / 2
+        too_high = shin_probs(pi, total, z).sum(axis=-1, keepdims=True) > 1
+        lo = np.where(too_high, z, lo)
+        hi = np.where(too_high, hi, z)
+    p = shin_probs(pi, total, (lo + hi) / 2)
+    return p / p.sum(axis=-1, keepdims=True)
+
+
+def devig(odds : np.ndarray, method="proportional"):
+    """
+    Removes the overround of decimal odds with shape (..., outcomes), batched over every other axis.
+    Rows with any missing outcome give NaN.
+    """
+    pi = implied(odds)
+    valid = ~np.isnan(pi).any(axis=-1, keepdims=True)
+    pi = np.where(valid, pi, 0.5)
+    if method == "proportional":
+        p = devig_proportional(pi)
+    elif method == "power":
+        p = devig_power(pi)
+    elif method == "shin":
+        p = devig_shin(pi)
+    else:
+        raise ValueError(f"Unknown method {method}, expected one of {METHODS}")
+    return np.where(valid, p, np.nan)
+
+
+def overround(odds : np.ndarray):
+    return implied(odds).sum(axis=-1) - 1
@@ -3,6 +3,8 @@ import json
 import os
 import pandas as pd
 
+import validation
+
 # Global variable for directory
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -118,13 +120,21 @@ def write_csv(dataframe : pd.DataFrame, name : str):
     output_file = os.path.join(processed_folder, name)
     dataframe.to_csv(output_file, index=False)
 
-if __name__ == "__main__":
+def main():
     players_data = read_season_players()
+    validation.check_stage(players_data, 'players_info.csv')
     write_csv(players_data,'players_info.csv')
     matches_data = get_matches()
+    validation.check_stage(matches_data, 'matches_info.csv')
     write_csv(matches_data, 'matches_info.csv')
     matches_lineups = get_info_from_matches()
+    validation.check_stage(matches_lineups, 'matches_lineups.csv')
     write_csv(matches_lineups, 'matches_lineups.csv')
     matches_final = concat_dfs(players_data,matches_lineups)
     matches_final = transform_data(matches_final)
+    validation.check_stage(matches_final, 'matches_final_info.csv')
     write_csv(matches_final, 'matches_final_info.csv')
+
+
+if __name__ == "__main__":
+    main()
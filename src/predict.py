@@ -0,0 +1,491 @@
+# ==========================================================
+#  predict.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import argparse
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import match_features
+import odds_math
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+# Same folders as training.py, which is only imported to rebuild the snapshot (it imports pandas)
+cache_dir = os.path.normpath(os.path.join(base_dir, '..', 'data', 'cache'))
+models_dir = os.path.normpath(os.path.join(base_dir, '..', 'models'))
+snapshot_path = os.path.join(cache_dir, 'snapshot.npz')
+model_path = os.path.join(models_dir, 'rf_result_abstract.joblib')
+forest_path = os.path.join(cache_dir, 'forest.npz')
+
+def build_snapshot(df, as_of=None, store_path=None):
+    """
+    State of each team with every match played before as_of, read from the feature store
+    (rebuilt from df): Elo after its last match, rolling stats of its last home and away
+    matches, its last known squad value and the market H/D/A of its last home and away
+    matches with odds. The store's as_of lookups give the same state.
+    """
+    import feature_store
+
+    store_path = store_path or feature_store.store_dir
+    feature_store.build_store(df, store_path)
+    return feature_store.team_snapshot(feature_store.open_store(store_path), as_of)
+
+
+def save_snapshot(snapshot : dict, path=snapshot_path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **snapshot)
+    print(f"Snapshot guardado en {path} ({len(snapshot['teams'])} equipos, hasta {snapshot['last_date']})")
+
+
+def load_snapshot(path=snapshot_path):
+    with np.load(path, allow_pickle=False) as cached:
+        snapshot = {name: cached[name] for name in cached.files}
+    snapshot["index"] = {team: i for i, team in enumerate(snapshot["teams"].tolist())}
+    return snapshot
+
+
+def pack_forest(model):
+    """
+    The trees of a fitted forest as flat arrays: children (-1 in the leaves), split feature and
+    threshold, side of the missing values and class fractions of every node
+    """
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    offsets = np.cumsum([0] + [t.node_count for t in trees])
+
+    def children(nodes, offset):
+        return np.where(nodes >= 0, nodes + offset, -1)
+
+    value = np.concatenate([t.value[:, 0, :] for t in trees])
+    return {
+        "roots": offsets[:-1],
+        "left": np.concatenate([children(t.children_left, o) for t, o in zip(trees, offsets)]),
+        "right": np.concatenate([children(t.children_right, o) for t, o in zip(trees, offsets)]),
+        "feature": np.concatenate([np.maximum(t.feature, 0) for t in trees]),
+        "threshold": np.concatenate([t.threshold for t in trees]),
+        "missing_left": np.concatenate([
+            np.asarray(getattr(t, "missing_go_to_left", np.zeros(t.node_count)), dtype=bool) for t in trees
+        ]),
+        "value": value / value.sum(axis=1, keepdims=True),
+    }
+
+
+def packed_proba(forest : dict, X : np.ndarray):
+    """
+    Walks every (fixture, tree) pair down one level per iteration until all reach a leaf
+    """
+    node = np.tile(forest["roots"], (len(X), 1))
+    rows = np.arange(len(X))[:, None]
+    leaf = forest["left"][node] < 0
+    while not leaf.all():
+        x = X[rows, forest["feature"][node]]
+        go_left = np.where(np.isnan(x), forest["missing_left"][node], x <= forest["threshold"][node])
+        node = np.where(leaf, node, np.where(go_left, forest["left"][node], forest["right"][node]))
+        leaf = forest["left"][node] < 0
+    return forest["value"][node].mean(axis=1)
+
+
+def model_key(path=model_path):
+    """Identity of the model file: absolute path, size and modification time in ns"""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def save_packed(bundle : dict, path=forest_path, key=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **pack_forest(bundle["model"]), model_classes=bundle["model"].classes_,
+             features=np.array(bundle["features"]), classes=np.array(bundle["classes"]), model_key=np.array(key))
+
+
+def load_packed(packed_path : str, key : str):
+    """The packed forest when it was packed from the model with this key, else None"""
+    if not os.path.exists(packed_path):
+        return None
+    with np.load(packed_path, allow_pickle=False) as cached:
+        if "model_key" not in cached.files or str(cached["model_key"]) != key:
+            return None
+        forest = {name: cached[name] for name in cached.files}
+    forest.pop("model_key")
+    return {
+        "model": forest,
+        "model_classes": forest.pop("model_classes"),
+        "features": forest.pop("features").tolist(),
+        "classes": forest.pop("classes").tolist(),
+    }
+
+
+def load_model(path=model_path, packed_path=forest_path):
+    """
+    Loads the packed forest when it was packed from this same model file (path, size and mtime
+    stored in the npz), so scoring doesn't unpickle scikit-learn. Otherwise loads the joblib
+    bundle and packs it for the next time.
+    """
+    key = model_key(path)
+    bundle = load_packed(packed_path, key)
+    if bundle is not None:
+        return bundle
+
+    import joblib
+
+    bundle = joblib.load(path)
+    # One thread per request: the thread pool costs more than the trees for a few rows
+    bundle["model"].set_params(n_jobs=1)
+    bundle["model_classes"] = bundle["model"].classes_
+    if hasattr(bundle["model"], "estimators_"):
+        save_packed(bundle, packed_path, key)
+    return bundle
+
+
+def forest_proba(model, X : np.ndarray):
+    """
+    Same average as RandomForestClassifier.predict_proba without its joblib dispatch and input
+    checks, which take most of the time when scoring a handful of fixtures
+    """
+    if isinstance(model, dict):
+        return packed_proba(model, X)
+    if not hasattr(model, "estimators_"):
+        return model.predict_proba(X)
+    proba = np.zeros((X.shape[0], len(model.classes_)))
+    for tree in model.estimators_:
+        votes = tree.tree_.predict(X)
+        proba += votes / votes.sum(axis=1, keepdims=True)
+    return proba / len(model.estimators_)
+
+
+def team_rows(snapshot : dict, teams : list[str]):
+    missing = [t for t in teams if t not in snapshot["index"]]
+    if missing:
+        raise KeyError(f"Unknown teams: {sorted(set(missing))}")
+    return np.fromiter((snapshot["index"][t] for t in teams), dtype=np.int64, count=len(teams))
+
+
+def fixture_features(snapshot : dict, home : list[str], away : list[str], odds=None, rivalidades=None):
+    """
+    Feature columns for a batch of fixtures, computed from the snapshot with numpy arrays.
+    The derived indices and the de-vig are the ones of the feature stages (match_features, odds_math).
+    """
+    h = team_rows(snapshot, home)
+    a = team_rows(snapshot, away)
+
+    cols = {}
+    cols["elo_home"] = snapshot["elo"][h]
+    cols["elo_away"] = snapshot["elo"][a]
+    cols["elo_diff"] = np.abs(cols["elo_home"] - cols["elo_away"])
+    for j, (_, feature) in enumerate(match_features.HOME_STATS):
+        cols[feature] = snapshot["home_stats"][h, j]
+    for j, (_, feature) in enumerate(match_features.AWAY_STATS):
+        cols[feature] = snapshot["away_stats"][a, j]
+    cols["goal_diff_form_home"] = cols["home_avg_goals_scored_7"] - cols["home_avg_goals_conceded_7"]
+    cols["goal_diff_form_away"] = cols["away_avg_goals_scored_7"] - cols["away_avg_goals_conceded_7"]
+    cols = match_features.add_index_features(cols)
+
+    cols["home_team_value"] = snapshot["value"][h]
+    cols["away_team_value"] = snapshot["value"][a]
+    cols = match_features.add_various_features(cols)
+
+    # Odds as (B365H, B365D, B365A), devigged as add_market_features. The model never saw
+    # zero-filled odds, so fixtures without odds take the last market H/D/A of the teams.
+    probs = odds_math.devig(check_odds(odds, len(home)))
+    imputed = np.isnan(probs).any(axis=1)
+    if imputed.any():
+        probs[imputed] = market_consensus(snapshot, h[imputed], a[imputed], np.flatnonzero(imputed))
+    cols["B365H_prob"], cols["B365D_prob"], cols["B365A_prob"] = probs.T
+    cols["prob_diff_home_away"] = cols["B365H_prob"] - cols["B365A_prob"]
+    cols["prob_fav_margin"] = probs.max(axis=1) - probs.min(axis=1)
+    cols["odds_imputed"] = imputed
+
+    if rivalidades is None:
+        rivalidades = match_features.load_rivalidades()
+    cols["derby"] = np.array([frozenset((x, y)) in rivalidades for x, y in zip(home, away)], dtype=np.int8)
+    return cols
+
+
+def market_consensus(snapshot : dict, h : np.ndarray, a : np.ndarray, fixtures : np.ndarray):
+    """
+    H/D/A for fixtures without odds: mean of the market probabilities of the home team's last
+    home match and the away team's last away match, normalized
+    """
+    if "home_market" not in snapshot:
+        raise ValueError("Snapshot without market probabilities. Rebuild it (predict snapshot) or pass the odds")
+    stacked = np.stack([snapshot["home_market"][h], snapshot["away_market"][a]])
+    unknown = np.isnan(stacked).all(axis=(0, 2))
+    if unknown.any():
+        raise ValueError(f"No odds and no market history for the teams of fixtures {fixtures[unknown].tolist()}, "
+                         f"pass the odds")
+    with np.errstate(invalid='ignore'):
+        probs = np.nanmean(stacked, axis=0)
+    return probs / probs.sum(axis=1, keepdims=True)
+
+
+def check_odds(odds, n : int):
+    """
+    Odds as a (n, 3) float array. Missing odds are NaN rows; given odds must be decimal odds > 1.
+    """
+    if odds is None:
+        return np.full((n, 3), np.nan)
+    try:
+        odds = np.asarray(odds, dtype=np.float64).reshape(n, 3)
+    except (TypeError, ValueError):
+        raise ValueError("Odds must be three numbers (B365H, B365D, B365A) per fixture")
+    given = ~np.isnan(odds).all(axis=1)
+    invalid = given & ~(np.isfinite(odds) & (odds > 1)).all(axis=1)
+    if invalid.any():
+        raise ValueError(f"Invalid odds (decimal odds must be > 1) in fixtures {np.flatnonzero(invalid).tolist()}")
+    return odds
+
+
+def parse_dates(dates : list):
+    """
+    Dates as datetime64[D], NaT for the fixtures without date
+    """
+    parsed = []
+    for d in dates:
+        try:
+            parsed.append(np.datetime64(str(d)[:10], 'D') if d is not None else np.datetime64('NaT'))
+        except ValueError:
+            raise ValueError(f"Invalid date {d!r}, expected YYYY-MM-DD")
+    return np.array(parsed, dtype='datetime64[D]')
+
+
+def check_dates(snapshot : dict, dates : list):
+    """
+    The snapshot must only contain matches played before the fixtures
+    """
+    last = np.datetime64(str(snapshot["last_date"]), 'D')
+    parsed = parse_dates(dates)
+    early = parsed[~np.isnat(parsed) & (parsed <= last)]
+    if len(early):
+        raise ValueError(f"Snapshot includes matches until {last}, newer than fixtures on "
+                         f"{sorted(set(str(d) for d in early))}. Rebuild it with --as-of")
+
+
+def check_fixtures(fixtures):
+    """
+    Schema of the fixtures of a request: home and away names, optional date and optional
+    odds [B365H, B365D, B365A]
+    """
+    if not isinstance(fixtures, list) or not fixtures:
+        raise ValueError("'fixtures' must be a non-empty list")
+    for i, f in enumerate(fixtures):
+        if not isinstance(f, dict):
+            raise ValueError(f"Fixture {i} must be an object")
+        for key in ("home", "away"):
+            if not isinstance(f.get(key), str) or not f[key]:
+                raise ValueError(f"Fixture {i}: '{key}' must be a team name")
+        if f.get("date") is not None and not isinstance(f["date"], str):
+            raise ValueError(f"Fixture {i}: 'date' must be a YYYY-MM-DD string")
+        odds = f.get("odds")
+        if odds is not None and (not isinstance(odds, list) or len(odds) != 3
+                                 or not all(isinstance(o, (int, float)) and not isinstance(o, bool) for o in odds)):
+            raise ValueError(f"Fixture {i}: 'odds' must be a list of three numbers [B365H, B365D, B365A]")
+
+
+def predict_fixtures(bundle : dict, snapshot : dict, home : list[str], away : list[str], dates=None, odds=None,
+                     rivalidades=None):
+    """
+    P(result_abstract) for a batch of fixtures with one predict_proba call, and whether the odds
+    of each fixture were imputed from the market history of its teams
+    """
+    if dates is not None:
+        check_dates(snapshot, dates)
+    cols = fixture_features(snapshot, home, away, odds, rivalidades)
+    X = np.ascontiguousarray(np.column_stack([cols[f] for f in bundle["features"]]), dtype=np.float32)
+    proba = np.zeros((len(home), len(bundle["classes"])))
+    proba[:, bundle["model_classes"]] = forest_proba(bundle["model"], X)
+    return proba, cols["odds_imputed"]
+
+
+def format_predictions(bundle : dict, home, away, dates, proba : np.ndarray, imputed : np.ndarray):
+    classes = bundle["classes"]
+    return [
+        {
+            "home": h, "away": a, "date": d,
+            "prediction": classes[int(p.argmax())],
+            "probabilities": {c: round(float(v), 6) for c, v in zip(classes, p)},
+            "odds_imputed": bool(i),
+        }
+        for h, a, d, p, i in zip(home, away, dates, proba, imputed)
+    ]
+
+
+def make_handler(bundle : dict, state : dict, features_path=None):
+    """
+    HTTP handler bound to the loaded model. state holds the snapshot and is swapped on /refresh.
+    """
+    from http.server import BaseHTTPRequestHandler
+
+    rivalidades = match_features.load_rivalidades()
+    lock = threading.Lock()
+
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def send_json(self, status : int, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def score(self, fixtures : list[dict]):
+            check_fixtures(fixtures)
+            start = time.perf_counter()
+            home = [f["home"] for f in fixtures]
+            away = [f["away"] for f in fixtures]
+            dates = [f.get("date") for f in fixtures]
+            odds = None
+            if any(f.get("odds") for f in fixtures):
+                odds = [f.get("odds") or [np.nan] * 3 for f in fixtures]
+            proba, imputed = predict_fixtures(bundle, state["snapshot"], home, away, dates, odds, rivalidades)
+            return {
+                "predictions": format_predictions(bundle, home, away, dates, proba, imputed),
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+            }
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                return self.send_json(200, {"status": "ok", "snapshot_date": str(state["snapshot"]["last_date"])})
+            if url.path != "/predict":
+                return self.send_json(404, {"error": f"Unknown path {url.path}"})
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                missing = [k for k in ("home", "away") if k not in query]
+                if missing:
+                    raise ValueError(f"Missing parameters {missing}")
+                fixture = {"home": query["home"], "away": query["away"], "date": query.get("date")}
+                if all(k in query for k in ("b365h", "b365d", "b365a")):
+                    try:
+                        fixture["odds"] = [float(query[k]) for k in ("b365h", "b365d", "b365a")]
+                    except ValueError:
+                        raise ValueError("b365h, b365d and b365a must be decimal odds")
+                result = self.score([fixture])
+            except (KeyError, ValueError) as e:
+                return self.send_json(400, {"error": str(e.args[0]) if e.args else str(e)})
+            result.update(result.pop("predictions")[0])
+            self.send_json(200, result)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path == "/refresh":
+                import training
+
+                with lock:
+                    snapshot = build_snapshot(training.load_features(features_path))
+                    save_snapshot(snapshot)
+                    state["snapshot"] = load_snapshot()
+                return self.send_json(200, {"status": "ok", "snapshot_date": str(state["snapshot"]["last_date"])})
+            if url.path != "/predict/batch":
+                return self.send_json(404, {"error": f"Unknown path {url.path}"})
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError as e:
+                    raise ValueError(f"Invalid JSON body: {e}")
+                if not isinstance(payload, dict) or "fixtures" not in payload:
+                    raise ValueError("Body must be a JSON object with a 'fixtures' list")
+                result = self.score(payload["fixtures"])
+            except (KeyError, ValueError) as e:
+                return self.send_json(400, {"error": str(e.args[0]) if e.args else str(e)})
+            self.send_json(200, result)
+
+        def log_message(self, format, *args):
+            pass
+
+    return PredictionHandler
+
+
+def serve(host : str, port : int, features_path=None):
+    from http.server import ThreadingHTTPServer
+
+    bundle = load_model()
+    state = {"snapshot": load_snapshot()}
+    server = ThreadingHTTPServer((host, port), make_handler(bundle, state, features_path))
+    print(f"Servidor de predicción en http://{host}:{port} (snapshot hasta {state['snapshot']['last_date']})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Predicts result_abstract for upcoming fixtures")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_snap = sub.add_parser("snapshot", help="Rebuilds the team snapshot (run after each matchday)")
+    p_snap.add_argument("--features", default=None, help="Path to laliga_features.csv")
+    p_snap.add_argument("--as-of", default=None, help="Only matches before this date (YYYY-MM-DD)")
+
+    p_fix = sub.add_parser("fixture", help="Predicts one fixture")
+    p_fix.add_argument("home")
+    p_fix.add_argument("away")
+    p_fix.add_argument("date", help="Match date (YYYY-MM-DD)")
+    p_fix.add_argument("--odds", nargs=3, type=float, metavar=("B365H", "B365D", "B365A"))
+
+    p_batch = sub.add_parser("batch", help="Predicts a matchday from a CSV with HomeTeam, AwayTeam, Date")
+    p_batch.add_argument("input")
+    p_batch.add_argument("--output", default=None)
+
+    p_serve = sub.add_parser("serve", help="Local HTTP endpoint")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8000)
+    p_serve.add_argument("--features", default=None, help="Path to laliga_features.csv used by /refresh")
+
+    args = parser.parse_args(argv)
+    try:
+        run_command(args)
+    except (KeyError, ValueError) as e:
+        # Unknown teams, stale snapshot, invalid odds or dates: one line instead of a traceback
+        parser.exit(1, f"Error: {e.args[0] if e.args else e}\n")
+
+
+def run_command(args):
+    if args.command == "snapshot":
+        import training
+
+        save_snapshot(build_snapshot(training.load_features(args.features), args.as_of))
+    elif args.command == "fixture":
+        bundle, snapshot = load_model(), load_snapshot()
+        start = time.perf_counter()
+        odds = [args.odds] if args.odds else None
+        proba, imputed = predict_fixtures(bundle, snapshot, [args.home], [args.away], [args.date], odds)
+        elapsed = (time.perf_counter() - start) * 1000
+        result = format_predictions(bundle, [args.home], [args.away], [args.date], proba, imputed)[0]
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        if imputed[0]:
+            print("Aviso: sin --odds, probabilidades de mercado de los últimos partidos de los equipos")
+        print(f"Tiempo de predicción: {elapsed:.2f} ms")
+    elif args.command == "batch":
+        import pandas as pd
+
+        fixtures = pd.read_csv(args.input)
+        bundle, snapshot = load_model(), load_snapshot()
+        odds_cols = ["B365H", "B365D", "B365A"]
+        odds = fixtures[odds_cols].to_numpy() if all(c in fixtures.columns for c in odds_cols) else None
+        proba, imputed = predict_fixtures(bundle, snapshot, fixtures["HomeTeam"].tolist(), fixtures["AwayTeam"].tolist(),
+                                 fixtures["Date"].astype(str).tolist(), odds)
+        out = pd.concat([fixtures, pd.DataFrame(proba, columns=[f"P_{c}" for c in bundle["classes"]])], axis=1)
+        out["prediction"] = np.asarray(bundle["classes"])[proba.argmax(axis=1)]
+        out["odds_imputed"] = imputed
+        if imputed.any():
+            print(f"Aviso: {imputed.sum()} partidos sin cuotas, probabilidades de mercado de los últimos partidos de los equipos")
+        if args.output:
+            out.to_csv(args.output, index=False)
+            print(f"Archivo guardado en {args.output}")
+        else:
+            print(out[["Date", "HomeTeam", "AwayTeam", "prediction"]].to_string(index=False))
+    elif args.command == "serve":
+        serve(args.host, args.port, args.features)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,37 +4,408 @@
 #  Author: Manuel Avilés Rodríguez
 # ==========================================================
 
-import pandas as pd
+import argparse
+import html
+import json
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
 
 # Global variable for directory
 base_dir = os.path.dirname(os.path.abspath(__file__))
+reports_dir = os.path.normpath(os.path.join(base_dir, '..', 'data', 'reports'))
 
-if __name__ == "__main__":
-    path = os.path.join(base_dir, '..', 'data', 'processed','laliga_features.csv')
-    path = os.path.normpath(path)
-    df = pd.read_csv(path)
+TARGETS = ['FTHG', 'FTAG']
+COUNT_COLUMNS = ['FTR', 'result_string', 'result_abstract']
+CHUNK_SIZE = 50_000
+HIST_BINS = 40
 
-    fig, axes = plt.subplots(2, 2, figsize=(16, 10))
 
-    df['result_string'].value_counts().plot(kind='bar', ax=axes[0,0], title='Result String Distribution')
-    axes[0,0].set_ylabel('Count')
+# ---------- Mergeable accumulators ----------
+# Every statistic is kept as counts, means and sums of squared deviations, so the
+# stats of two chunks (or two seasons, or two leagues) merge exactly (Chan et al.)
+
+def divide(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(b > 0, a / b, np.nan)
+
+
+def chunk_moments(X : np.ndarray):
+    """
+    Count, mean, sum of squared deviations, min and max of every column, ignoring NaN
+    """
+    mask = ~np.isnan(X)
+    n = mask.sum(axis=0)
+    mean = divide(np.where(mask, X, 0).sum(axis=0), n)
+    m2 = (np.where(mask, X - mean, 0) ** 2).sum(axis=0)
+    return {
+        'n': n,
+        'mean': mean,
+        'm2': m2,
+        'min': np.where(n > 0, np.where(mask, X, np.inf).min(axis=0, initial=np.inf), np.nan),
+        'max': np.where(n > 0, np.where(mask, X, -np.inf).max(axis=0, initial=-np.inf), np.nan),
+    }
+
+
+def merged_mean(mean_a, n_a, mean_b, n_b):
+    return np.where(n_a == 0, mean_b, np.where(n_b == 0, mean_a, mean_a + divide((mean_b - mean_a) * n_b, n_a + n_b)))
+
+
+def merge_moments(a : dict, b : dict):
+    n = a['n'] + b['n']
+    delta = np.nan_to_num(b['mean'] - a['mean'])
+    return {
+        'n': n,
+        'mean': merged_mean(a['mean'], a['n'], b['mean'], b['n']),
+        'm2': a['m2'] + b['m2'] + np.nan_to_num(divide(delta ** 2 * a['n'] * b['n'], n)),
+        'min': np.fmin(a['min'], b['min']),
+        'max': np.fmax(a['max'], b['max']),
+    }
+
+
+def chunk_comoments(X : np.ndarray, Y : np.ndarray):
+    """
+    Co-moments of every column with every target over their pairwise complete rows,
+    arrays of shape (targets, columns). Every sum is a (targets, rows) @ (rows, columns)
+    product, so the chunk is never broadcast to targets x rows x columns. The columns are
+    shifted by their chunk mean first, which doesn't change the co-moments.
+    """
+    valid_x = ~np.isnan(X)
+    valid_y = ~np.isnan(Y)
+    shift_x = np.nan_to_num(divide(np.where(valid_x, X, 0).sum(axis=0), valid_x.sum(axis=0)))
+    shift_y = np.nan_to_num(divide(np.where(valid_y, Y, 0).sum(axis=0), valid_y.sum(axis=0)))
+    W = valid_x.astype(np.float64)
+    V = valid_y.T.astype(np.float64)
+    x = np.where(valid_x, X - shift_x, 0)
+    y = np.where(valid_y, Y - shift_y, 0).T
+
+    n = V @ W
+    mean_x = divide(V @ x, n)
+    mean_y = divide(y @ W, n)
+    sx, sy = np.nan_to_num(mean_x), np.nan_to_num(mean_y)
+    return {
+        'n': n, 'mean_x': mean_x + shift_x[None, :], 'mean_y': mean_y + shift_y[:, None],
+        'mxx': np.maximum(V @ (x * x) - n * sx * sx, 0),
+        'myy': np.maximum((y * y) @ W - n * sy * sy, 0),
+        'mxy': y @ x - n * sx * sy,
+    }
+
+
+def merge_comoments(a : dict, b : dict):
+    n = a['n'] + b['n']
+    weight = np.nan_to_num(divide(a['n'] * b['n'], n))
+    dx = np.nan_to_num(b['mean_x'] - a['mean_x'])
+    dy = np.nan_to_num(b['mean_y'] - a['mean_y'])
+    return {
+        'n': n,
+        'mean_x': merged_mean(a['mean_x'], a['n'], b['mean_x'], b['n']),
+        'mean_y': merged_mean(a['mean_y'], a['n'], b['mean_y'], b['n']),
+        'mxx': a['mxx'] + b['mxx'] + dx * dx * weight,
+        'myy': a['myy'] + b['myy'] + dy * dy * weight,
+        'mxy': a['mxy'] + b['mxy'] + dx * dy * weight,
+    }
+
+
+def histogram_width(values : np.ndarray):
+    """Power of two close to range / HIST_BINS, so histograms of different chunks share their edges"""
+    span = values.max() - values.min()
+    return 2.0 ** np.floor(np.log2(span / HIST_BINS)) if span > 0 else 1.0
+
+
+def coarsen(hist : dict, width : float):
+    """Histogram with a wider bin (a power-of-two multiple); bins are anchored at 0, so they nest"""
+    factor = int(round(width / hist['width']))
+    if factor == 1:
+        return hist
+    counts = Counter()
+    for b, c in hist['counts'].items():
+        counts[b // factor] += c
+    return {'width': width, 'counts': counts}
+
+
+def chunk_histograms(X : np.ndarray):
+    """
+    Sparse histogram of every column, bins [k * width, (k + 1) * width) as {k: count}.
+    None for the columns without finite values.
+    """
+    hists = []
+    for j in range(X.shape[1]):
+        values = X[:, j][np.isfinite(X[:, j])]
+        if not len(values):
+            hists.append(None)
+            continue
+        width = histogram_width(values)
+        bins, counts = np.unique(np.floor(values / width).astype(np.int64), return_counts=True)
+        hists.append({'width': width, 'counts': Counter(dict(zip(bins.tolist(), counts.tolist())))})
+    return hists
+
+
+def merge_histogram(a, b):
+    if a is None or b is None:
+        return b if a is None else a
+    width = max(a['width'], b['width'])
+    merged = {'width': width, 'counts': coarsen(a, width)['counts'] + coarsen(b, width)['counts']}
+    # Values far from the first chunk's range widen the bins instead of growing the dict
+    while max(merged['counts']) - min(merged['counts']) >= 4 * HIST_BINS:
+        merged = coarsen(merged, merged['width'] * 2)
+    return merged
+
+
+def histogram_table(hist):
+    """Edges and counts with at most HIST_BINS bins, empty bins included"""
+    if hist is None:
+        return None
+    while max(hist['counts']) - min(hist['counts']) >= HIST_BINS:
+        hist = coarsen(hist, hist['width'] * 2)
+    first, last = min(hist['counts']), max(hist['counts'])
+    return {
+        'edges': [k * hist['width'] for k in range(first, last + 2)],
+        'counts': [int(hist['counts'].get(k, 0)) for k in range(first, last + 1)],
+    }
+
+
+def chunk_stats(df : pd.DataFrame, columns : list[str], numeric : list[str], targets : list[str]):
+    """
+    Accumulator of one chunk: rows, nulls of every column, moments and histograms of the numeric
+    columns, co-moments with the targets and value counts of the result columns
+    """
+    df = df.reindex(columns=columns)
+    X = df[numeric].to_numpy(dtype=np.float64)
+    Y = df[targets].to_numpy(dtype=np.float64)
+    return {
+        'rows': len(df),
+        'nulls': df.isna().sum().to_numpy(),
+        'moments': chunk_moments(X),
+        'comoments': chunk_comoments(X, Y),
+        'histograms': chunk_histograms(X),
+        'counts': {c: Counter(df[c].dropna().astype(str).tolist()) for c in COUNT_COLUMNS if c in columns},
+    }
+
 
-    df['result_abstract'].value_counts().plot(kind='bar', ax=axes[0,1], title='Abstract Result Distribution')
-    axes[0,1].set_ylabel('Count')
+def merge_stats(a : dict, b : dict):
+    return {
+        'rows': a['rows'] + b['rows'],
+        'nulls': a['nulls'] + b['nulls'],
+        'moments': merge_moments(a['moments'], b['moments']),
+        'comoments': merge_comoments(a['comoments'], b['comoments']),
+        'histograms': [merge_histogram(x, y) for x, y in zip(a['histograms'], b['histograms'])],
+        'counts': {c: a['counts'][c] + b['counts'][c] for c in a['counts']},
+    }
 
-    df.corr(numeric_only=True)['FTHG'].sort_values(ascending=False).head(15).plot(kind='bar', ax=axes[1,0], title='Top Correlations with FTHG')
 
-    df.corr(numeric_only=True)['FTAG'].sort_values(ascending=False).head(15).plot(kind='bar', ax=axes[1,1], title='Top Correlations with FTAG')
-    pd.set_option('display.max_columns', None)
-    pd.set_option('display.max_rows', None)
-    pd.set_option('display.width', None)
-    pd.set_option('display.max_colwidth', None)
-    print(f"SHAPE DATASET: \n{df.shape}\n")
-    print(f"DESCRIBE DATASET: \n{df.describe().T}\n")
-    print(f"TOTAL NULOS: \n{df.isnull().sum()}")
+def correlations(comoments : dict):
+    """Pearson correlation with each target, same as df.corr() on the pairwise complete rows"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(comoments['n'] > 1, comoments['mxy'] / np.sqrt(comoments['mxx'] * comoments['myy']), np.nan)
 
+
+# ---------- Single pass over the files ----------
+
+def scan(paths : list[str], group='Season', chunksize=CHUNK_SIZE, targets=TARGETS):
+    """
+    Reads the CSVs in chunks once and accumulates the stats of every group (season, league...).
+    The total is the merge of the groups. Columns come from the first file; missing ones are NaN.
+    """
+    groups, columns, numeric = {}, None, None
+    for path in paths:
+        for chunk in pd.read_csv(path, chunksize=chunksize, low_memory=False):
+            if columns is None:
+                columns = list(chunk.columns)
+                numeric = [c for c in columns if pd.api.types.is_numeric_dtype(chunk[c])]
+                targets = [t for t in targets if t in numeric]
+            keys = chunk[group].astype(str) if group in chunk.columns else pd.Series('all', index=chunk.index)
+            for key, part in chunk.groupby(keys, sort=False):
+                stats = chunk_stats(part, columns, numeric, targets)
+                groups[key] = merge_stats(groups[key], stats) if key in groups else stats
+
+    total = None
+    for key in sorted(groups):
+        total = groups[key] if total is None else merge_stats(total, groups[key])
+    return {'columns': columns, 'numeric': numeric, 'targets': targets, 'groups': dict(sorted(groups.items())),
+            'total': total}
+
+
+# ---------- Summaries ----------
+
+def describe(stats : dict, columns : list[str], numeric : list[str], targets : list[str]):
+    """
+    describe() of the numeric columns plus null rate and correlation with the targets
+    """
+    m = stats['moments']
+    table = pd.DataFrame({
+        'count': m['n'],
+        'mean': m['mean'],
+        'std': np.sqrt(divide(m['m2'], m['n'] - 1)),
+        'min': m['min'],
+        'max': m['max'],
+    }, index=numeric)
+    nulls = pd.Series(stats['nulls'], index=columns)
+    table['null_rate'] = nulls[numeric] / max(stats['rows'], 1)
+    corr = correlations(stats['comoments'])
+    for i, t in enumerate(targets):
+        table[f'corr_{t}'] = corr[i]
+    return table
+
+
+def summary(stats : dict, scanned : dict, top : int):
+    table = describe(stats, scanned['columns'], scanned['numeric'], scanned['targets'])
+    nulls = pd.Series(stats['nulls'], index=scanned['columns'])
+    return {
+        'rows': int(stats['rows']),
+        'null_rate': {c: float(v) for c, v in (nulls / max(stats['rows'], 1)).items() if v > 0},
+        'columns': json.loads(table.to_json(orient='index')),
+        'top_correlations': {
+            t: json.loads(table[f'corr_{t}'].drop(t, errors='ignore').dropna().sort_values(ascending=False)
+                          .head(top).to_json())
+            for t in scanned['targets']
+        },
+        'value_counts': {c: dict(counts.most_common(top)) for c, counts in stats['counts'].items()},
+    }
+
+
+def build_report(scanned : dict, top=15):
+    total = summary(scanned['total'], scanned, top)
+    total['histograms'] = {
+        c: histogram_table(h) for c, h in zip(scanned['numeric'], scanned['total']['histograms']) if h is not None
+    }
+    return {
+        'total': total,
+        'groups': {key: summary(stats, scanned, top) for key, stats in scanned['groups'].items()},
+    }
+
+
+# ---------- Rendering ----------
+
+def render_figures(report : dict, output_dir : str, show=False):
+    """
+    Distribution of the results, top correlations with the targets, null rate per group and
+    histograms of the numeric columns, drawn with the Agg backend (no display needed) unless show=True
+    """
+    import matplotlib
+    if not show:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    total = report['total']
+    fig, axes = plt.subplots(2, 2, figsize=(16, 10))
+    panels = [
+        (pd.Series(total['value_counts'].get('result_string', {})), 'Result String Distribution'),
+        (pd.Series(total['value_counts'].get('result_abstract', {})), 'Abstract Result Distribution'),
+    ] + [
+        (pd.Series(corr), f'Top Correlations with {t}') for t, corr in total['top_correlations'].items()
+    ]
+    for ax, (series, title) in zip(axes.ravel(), panels):
+        if not series.empty:
+            series.plot(kind='bar', ax=ax, title=title)
+    axes[0, 0].set_ylabel('Count')
+    axes[0, 1].set_ylabel('Count')
     plt.tight_layout()
-    plt.show()
+
+    path = os.path.join(output_dir, 'exploracion.png')
+    fig.savefig(path, dpi=100)
+    figures = [path]
+
+    # dtype=float: groups without nulls give empty dicts, which would make object columns
+    null_rates = pd.DataFrame({
+        k: pd.Series(g['null_rate'], dtype=float) for k, g in report['groups'].items()
+    }, dtype=float).fillna(0)
+    if not null_rates.empty:
+        fig2, ax = plt.subplots(figsize=(max(8, len(null_rates.columns) * 0.6), max(4, len(null_rates) * 0.3)))
+        image = ax.imshow(null_rates.to_numpy(), aspect='auto', cmap='Reds', vmin=0, vmax=1)
+        ax.set_xticks(range(len(null_rates.columns)), null_rates.columns, rotation=90)
+        ax.set_yticks(range(len(null_rates.index)), null_rates.index)
+        ax.set_title('Null rate per group')
+        fig2.colorbar(image, ax=ax)
+        plt.tight_layout()
+        path = os.path.join(output_dir, 'nulos_por_grupo.png')
+        fig2.savefig(path, dpi=100)
+        figures.append(path)
+
+    histograms = total.get('histograms', {})
+    if histograms:
+        cols = 6
+        rows = -(-len(histograms) // cols)
+        fig3, axes = plt.subplots(rows, cols, figsize=(cols * 3, rows * 2.2), squeeze=False)
+        for ax, (column, hist) in zip(axes.ravel(), histograms.items()):
+            ax.stairs(hist['counts'], hist['edges'], fill=True)
+            ax.set_title(column, fontsize=8)
+            ax.tick_params(labelsize=6)
+        for ax in axes.ravel()[len(histograms):]:
+            ax.axis('off')
+        plt.tight_layout()
+        path = os.path.join(output_dir, 'histogramas.png')
+        fig3.savefig(path, dpi=80)
+        figures.append(path)
+
+    if show:
+        plt.show()
+    plt.close('all')
+    return figures
+
+
+def render_html(report : dict, figures : list[str], output_dir : str, top=15):
+    total = report['total']
+    columns = pd.DataFrame(total['columns']).T
+    groups = pd.DataFrame({
+        key: {'rows': g['rows'], **{c: g['columns'].get(c, {}).get('mean') for c in TARGETS}}
+        for key, g in report['groups'].items()
+    }).T
+    sections = [
+        f"<h1>Exploración</h1><p>{total['rows']} filas, {len(columns)} columnas numéricas</p>",
+        *[f'<img src="{os.path.basename(f)}">' for f in figures],
+        "<h2>Grupos</h2>", groups.to_html(float_format=lambda v: f"{v:.3f}"),
+        "<h2>Columnas</h2>", columns.to_html(float_format=lambda v: f"{v:.4g}"),
+        "<h2>Resultados más frecuentes</h2>",
+        *[f"<h3>{html.escape(c)}</h3>" + pd.Series(counts).head(top).to_frame('count').to_html()
+          for c, counts in total['value_counts'].items()],
+    ]
+    path = os.path.join(output_dir, 'exploracion.html')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<html><head><meta charset="utf-8"><title>Exploración</title></head><body>\n')
+        f.write('\n'.join(sections))
+        f.write('\n</body></html>\n')
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exploratory report of the feature tables in one chunked pass")
+    parser.add_argument("--input", nargs='+', default=None,
+                        help="CSVs to scan, e.g. one per league (default laliga_features.csv)")
+    parser.add_argument("--group", default='Season', help="Column the stats are grouped by")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output-dir", default=reports_dir)
+    parser.add_argument("--show", action="store_true", help="Also opens the figures in a window")
+    args = parser.parse_args(argv)
+
+    paths = args.input or [os.path.normpath(os.path.join(base_dir, '..', 'data', 'processed', 'laliga_features.csv'))]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    scanned = scan(paths, args.group, args.chunksize)
+    report = build_report(scanned, args.top)
+    print(f"Pasada única sobre {len(paths)} ficheros en {time.perf_counter() - start:.2f}s")
+
+    json_path = os.path.join(args.output_dir, 'exploracion.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    figures = render_figures(report, args.output_dir, args.show)
+    html_path = render_html(report, figures, args.output_dir, args.top)
+
+    total = report['total']
+    print(f"SHAPE DATASET: ({total['rows']}, {len(scanned['columns'])})")
+    print(f"GRUPOS ({args.group}): {len(report['groups'])}")
+    if total['null_rate']:
+        nulls = pd.Series(total['null_rate']).sort_values(ascending=False).head(args.top)
+        print(f"COLUMNAS CON MÁS NULOS: \n{nulls.to_string(float_format=lambda v: f'{v:.1%}')}\n")
+    for t, corr in total['top_correlations'].items():
+        print(f"TOP CORRELACIONES CON {t}: \n{pd.Series(corr).to_string(float_format=lambda v: f'{v:.3f}')}\n")
+    for path in [json_path, html_path, *figures]:
+        print(f"Archivo guardado en {path}")
+
+
+if __name__ == "__main__":
+    main()
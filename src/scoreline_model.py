@@ -0,0 +1,271 @@
+# ==========================================================
+#  scoreline_model.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+MAX_GOALS = 10
+DECAY = 0.0019  # per day, half-life of about one year
+RIDGE = 1e-3
+BUCKETS = ["0", "1", "2", "M"]
+RESULT_CLASSES = [f"{h}-{a}" for h in BUCKETS for a in BUCKETS]
+
+SCORELINE_FEATURES = (
+    ["dc_lambda_home", "dc_lambda_away", "dc_prob_home", "dc_prob_draw", "dc_prob_away"]
+    + [f"dc_prob_{c.replace('-', '_')}" for c in RESULT_CLASSES]
+)
+
+
+def tau_terms(hg, ag, lam, mu, rho):
+    """
+    Dixon-Coles correction for the low scores and the derivatives of log(tau)
+    with respect to log(lambda), log(mu) and rho
+    """
+    tau = np.ones_like(lam)
+    d_lam = np.zeros_like(lam)
+    d_mu = np.zeros_like(lam)
+    d_rho = np.zeros_like(lam)
+
+    m00 = (hg == 0) & (ag == 0)
+    m01 = (hg == 0) & (ag == 1)
+    m10 = (hg == 1) & (ag == 0)
+    m11 = (hg == 1) & (ag == 1)
+
+    tau[m00] = 1 - lam[m00] * mu[m00] * rho
+    tau[m01] = 1 + lam[m01] * rho
+    tau[m10] = 1 + mu[m10] * rho
+    tau[m11] = 1 - rho
+    tau = np.maximum(tau, 1e-10)
+
+    d_lam[m00] = -lam[m00] * mu[m00] * rho / tau[m00]
+    d_mu[m00] = d_lam[m00]
+    d_lam[m01] = lam[m01] * rho / tau[m01]
+    d_mu[m10] = mu[m10] * rho / tau[m10]
+
+    d_rho[m00] = -lam[m00] * mu[m00] / tau[m00]
+    d_rho[m01] = lam[m01] / tau[m01]
+    d_rho[m10] = mu[m10] / tau[m10]
+    d_rho[m11] = -1 / tau[m11]
+    return tau, d_lam, d_mu, d_rho
+
+
+def unpack(params : np.ndarray, n_teams : int):
+    attack = params[:n_teams]
+    defence = params[n_teams:2 * n_teams]
+    base, home_adv, rho = params[2 * n_teams:]
+    return attack, defence, base, home_adv, rho
+
+
+def rates(params : np.ndarray, n_teams : int, home_idx : np.ndarray, away_idx : np.ndarray):
+    attack, defence, base, home_adv, _ = unpack(params, n_teams)
+    lam = np.exp(base + home_adv + attack[home_idx] - defence[away_idx])
+    mu = np.exp(base + attack[away_idx] - defence[home_idx])
+    return lam, mu
+
+
+def negative_log_likelihood(params, n_teams, home_idx, away_idx, hg, ag, weights, ridge=RIDGE):
+    """
+    Weighted Dixon-Coles negative log-likelihood and its gradient, both vectorized over the matches.
+    The gradients of the team parameters are scatter-added with bincount.
+    """
+    attack, defence, _, _, rho = unpack(params, n_teams)
+    lam, mu = rates(params, n_teams, home_idx, away_idx)
+    tau, d_lam, d_mu, d_rho = tau_terms(hg, ag, lam, mu, rho)
+
+    total = weights.sum()
+    ll = weights * (hg * np.log(lam) - lam + ag * np.log(mu) - mu + np.log(tau))
+    g_lam = weights * (hg - lam + d_lam)
+    g_mu = weights * (ag - mu + d_mu)
+
+    grad = np.empty_like(params)
+    grad[:n_teams] = np.bincount(home_idx, g_lam, n_teams) + np.bincount(away_idx, g_mu, n_teams)
+    grad[n_teams:2 * n_teams] = -np.bincount(away_idx, g_lam, n_teams) - np.bincount(home_idx, g_mu, n_teams)
+    grad[2 * n_teams] = g_lam.sum() + g_mu.sum()
+    grad[2 * n_teams + 1] = g_lam.sum()
+    grad[2 * n_teams + 2] = (weights * d_rho).sum()
+
+    # Ridge on the team strengths keeps them identifiable and the teams without matches at 0
+    value = -ll.sum() / total + ridge * (attack @ attack + defence @ defence)
+    grad = -grad / total
+    grad[:n_teams] += 2 * ridge * attack
+    grad[n_teams:2 * n_teams] += 2 * ridge * defence
+    return value, grad
+
+
+def fit_dixon_coles(home_idx, away_idx, hg, ag, weights, n_teams, x0=None):
+    """
+    Fits the attack/defence strengths, the base rate, the home advantage and rho with L-BFGS-B
+    """
+    from scipy.optimize import minimize
+
+    if x0 is None:
+        x0 = np.zeros(2 * n_teams + 3)
+        x0[2 * n_teams] = np.log(max(np.average((hg + ag) / 2, weights=weights), 1e-3))
+    bounds = [(None, None)] * (2 * n_teams + 2) + [(-0.2, 0.2)]
+    result = minimize(
+        negative_log_likelihood, x0, jac=True, method="L-BFGS-B", bounds=bounds,
+        args=(n_teams, home_idx, away_idx, hg.astype(np.float64), ag.astype(np.float64), weights),
+    )
+    return result.x
+
+
+def score_matrix(lam : np.ndarray, mu : np.ndarray, rho : float, max_goals=MAX_GOALS):
+    """
+    P(home goals = i, away goals = j) for every match, shape (n_matches, max_goals + 1, max_goals + 1)
+    """
+    from scipy.stats import poisson
+
+    goals = np.arange(max_goals + 1)
+    p_home = poisson.pmf(goals[None, :], lam[:, None])
+    p_away = poisson.pmf(goals[None, :], mu[:, None])
+    matrix = p_home[:, :, None] * p_away[:, None, :]
+
+    matrix[:, 0, 0] *= 1 - lam * mu * rho
+    matrix[:, 0, 1] *= 1 + lam * rho
+    matrix[:, 1, 0] *= 1 + mu * rho
+    matrix[:, 1, 1] *= 1 - rho
+    np.maximum(matrix, 0, out=matrix)
+    return matrix / matrix.sum(axis=(1, 2), keepdims=True)
+
+
+def collapse_results(matrix : np.ndarray):
+    """
+    Score matrices into the result_abstract classes (0, 1, 2 or M goals per side), same order as RESULT_CLASSES
+    """
+    goals = np.arange(matrix.shape[1])
+    buckets = np.zeros((len(goals), len(BUCKETS)))
+    buckets[goals, np.minimum(goals, len(BUCKETS) - 1)] = 1
+    probs = np.einsum("nij,ia,jb->nab", matrix, buckets, buckets)
+    return probs.reshape(len(matrix), -1)
+
+
+def outcome_probs(matrix : np.ndarray):
+    """
+    Home win, draw and away win probabilities from the score matrices
+    """
+    home = np.tril(np.ones(matrix.shape[1:]), -1)
+    draw = np.eye(matrix.shape[1])
+    return (
+        (matrix * home).sum(axis=(1, 2)),
+        (matrix * draw).sum(axis=(1, 2)),
+        (matrix * home.T).sum(axis=(1, 2)),
+    )
+
+
+def walk_forward_fit(df : pd.DataFrame, cadence="season", decay=DECAY):
+    """
+    Refits the model at the start of every season (or month) with all the matches played before,
+    weighted by exp(-decay * days ago), and predicts the matches of that period.
+    The first period has no previous matches and gets NaN.
+    Returns (lambda, mu, rho) per row, aligned with df.
+    """
+    dates = pd.to_datetime(df["Date"], errors="coerce")
+    teams = pd.Index(sorted(pd.concat([df["HomeTeam"], df["AwayTeam"]]).unique()))
+    home_idx = teams.get_indexer(df["HomeTeam"])
+    away_idx = teams.get_indexer(df["AwayTeam"])
+    hg = df["FTHG"].to_numpy(dtype=np.float64)
+    ag = df["FTAG"].to_numpy(dtype=np.float64)
+    days = ((dates - dates.min()).dt.days).to_numpy(dtype=np.float64)
+
+    if cadence == "season":
+        if "Season" in df.columns:
+            period = df["Season"].astype(str).to_numpy()
+        else:
+            import feature_engineering
+            period = dates.apply(feature_engineering.get_season).astype(str).to_numpy()
+    elif cadence == "month":
+        period = dates.dt.to_period("M").astype(str).to_numpy()
+    else:
+        raise ValueError(f"Unknown cadence {cadence}, expected season or month")
+
+    lam = np.full(len(df), np.nan)
+    mu = np.full(len(df), np.nan)
+    rho = np.full(len(df), np.nan)
+    played = ~(np.isnan(hg) | np.isnan(ag) | np.isnan(days))
+
+    params = None
+    for p in sorted(set(period)):
+        rows = np.flatnonzero(period == p)
+        start = np.nanmin(days[rows])
+        train = played & (days < start)
+        if not train.any():
+            continue
+        weights = np.exp(-decay * (start - days[train]))
+        params = fit_dixon_coles(home_idx[train], away_idx[train], hg[train], ag[train], weights, len(teams), params)
+        lam[rows], mu[rows] = rates(params, len(teams), home_idx[rows], away_idx[rows])
+        rho[rows] = params[-1]
+    return lam, mu, rho
+
+
+def scoreline_probabilities(lam : np.ndarray, mu : np.ndarray, rho : np.ndarray):
+    """
+    result_abstract probabilities (n_matches, 16) and outcome probabilities for a batch of matches
+    """
+    known = ~np.isnan(lam)
+    probs = np.full((len(lam), len(RESULT_CLASSES)), np.nan)
+    outcomes = np.full((len(lam), 3), np.nan)
+    if known.any():
+        # rho is the same for every match of a refit, group by it to use the batched score matrix
+        for r in np.unique(rho[known]):
+            sel = known & (rho == r)
+            matrix = score_matrix(lam[sel], mu[sel], r)
+            probs[sel] = collapse_results(matrix)
+            outcomes[sel] = np.column_stack(outcome_probs(matrix))
+    return probs, outcomes
+
+
+def add_scoreline_features(df : pd.DataFrame, cadence="season", decay=DECAY):
+    """
+    Dixon-Coles expected goals and result probabilities, fitted only with previous matches
+    """
+    lam, mu, rho = walk_forward_fit(df, cadence, decay)
+    probs, outcomes = scoreline_probabilities(lam, mu, rho)
+
+    df["dc_lambda_home"] = lam
+    df["dc_lambda_away"] = mu
+    df["dc_prob_home"], df["dc_prob_draw"], df["dc_prob_away"] = outcomes.T
+    for j, c in enumerate(RESULT_CLASSES):
+        df[f"dc_prob_{c.replace('-', '_')}"] = probs[:, j]
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dixon-Coles scoreline model as result_abstract baseline")
+    parser.add_argument("--input", default=None, help="CSV with Date, HomeTeam, AwayTeam, FTHG, FTAG")
+    parser.add_argument("--cadence", choices=["season", "month"], default="season")
+    parser.add_argument("--decay", type=float, default=DECAY)
+    args = parser.parse_args(argv)
+
+    import backtest
+    import feature_engineering
+
+    path = args.input or os.path.join(base_dir, '..', 'data', 'processed', 'LaLiga_combined.csv')
+    df = pd.read_csv(os.path.normpath(path)).sort_values("Date", kind="mergesort").reset_index(drop=True)
+    df = feature_engineering.get_resultado_M(df)
+
+    start = time.perf_counter()
+    lam, mu, rho = walk_forward_fit(df, args.cadence, args.decay)
+    probs, _ = scoreline_probabilities(lam, mu, rho)
+    print(f"Ajuste de todas las temporadas: {time.perf_counter() - start:.2f}s")
+
+    seasons = pd.to_datetime(df["Date"]).apply(feature_engineering.get_season)
+    y = pd.Categorical(df["result_abstract"], categories=RESULT_CLASSES).codes
+    rows = []
+    for season in sorted(seasons[~np.isnan(lam)].unique()):
+        sel = ((seasons == season) & ~np.isnan(lam)).to_numpy()
+        rows.append({"Season": season, **backtest.season_metrics(y[sel], probs[sel])})
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+
+
+if __name__ == "__main__":
+    main()
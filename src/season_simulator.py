@@ -0,0 +1,274 @@
+# ==========================================================
+#  season_simulator.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+CHUNK_SIMS = 5000
+MARKET_COLUMNS = ["B365H_prob", "B365D_prob", "B365A_prob"]
+# H/D/A of the Dixon-Coles model, used for the fixtures without odds
+SCORELINE_OUTCOME_COLUMNS = ["dc_prob_home", "dc_prob_draw", "dc_prob_away"]
+# Nominal scoreline of each outcome when only H/D/A probabilities are available
+OUTCOME_GOALS = {"H": (1, 0), "D": (1, 1), "A": (0, 1)}
+
+
+def class_goals(labels : list[str]):
+    """
+    Goals of each result class: result_abstract labels ('2-1', 'M-0'... with M as 3 goals)
+    or the outcomes H, D, A
+    """
+    home, away = [], []
+    for label in labels:
+        if label in OUTCOME_GOALS:
+            h, a = OUTCOME_GOALS[label]
+        else:
+            h, a = (3 if g == "M" else int(g) for g in label.split("-"))
+        home.append(h)
+        away.append(a)
+    return np.array(home, dtype=np.int16), np.array(away, dtype=np.int16)
+
+
+def missing_rows(probs : np.ndarray):
+    """Rows that aren't a distribution: NaN, negative or summing 0 (zero-filled odds)"""
+    return ~(np.isfinite(probs).all(axis=1) & (probs >= 0).all(axis=1) & (probs.sum(axis=1) > 0))
+
+
+def fill_missing(probs : np.ndarray, fallback=None):
+    """
+    Replaces the missing rows with the fallback probabilities where those are valid, else uniform
+    """
+    probs = np.array(probs, dtype=np.float64)
+    missing = missing_rows(probs)
+    if fallback is not None:
+        fallback = np.asarray(fallback, dtype=np.float64)
+        use = missing & ~missing_rows(fallback)
+        probs[use] = fallback[use]
+        missing &= ~use
+    probs[missing] = 1 / probs.shape[1]
+    return probs
+
+
+def sample_classes(cum_probs : np.ndarray, n_sims : int, rng : np.random.Generator):
+    """
+    One result class per (sim, match) by inverse CDF. Comparing against one column of the
+    cumulative probabilities at a time keeps the memory at sims x matches.
+    """
+    u = rng.random((n_sims, cum_probs.shape[0]))
+    classes = np.zeros(u.shape, dtype=np.int16)
+    for k in range(cum_probs.shape[1] - 1):
+        classes += u > cum_probs[:, k]
+    return classes
+
+
+def scatter_add(team_idx : np.ndarray, values : np.ndarray, n_teams : int):
+    """
+    Sum of values (sims x matches) per (sim, team) with a single bincount
+    """
+    n_sims = values.shape[0]
+    flat = (np.arange(n_sims)[:, None] * n_teams + team_idx[None, :]).ravel()
+    return np.bincount(flat, weights=values.ravel(), minlength=n_sims * n_teams).reshape(n_sims, n_teams)
+
+
+def final_positions(home_idx, away_idx, hg, ag, n_teams : int, rng : np.random.Generator):
+    """
+    Final position of every team in every sim (0 = champion) with the LaLiga tiebreaks:
+    points, head-to-head points and goal difference among the tied teams, goal difference,
+    goals scored and a random draw. Teams with the same points form the head-to-head mini-league,
+    so only the matches between teams level on points count for it.
+    """
+    n_sims = hg.shape[0]
+    pts_home = np.where(hg > ag, 3, np.where(hg == ag, 1, 0))
+    pts_away = np.where(ag > hg, 3, np.where(hg == ag, 1, 0))
+
+    points = scatter_add(home_idx, pts_home, n_teams) + scatter_add(away_idx, pts_away, n_teams)
+    goals_for = scatter_add(home_idx, hg, n_teams) + scatter_add(away_idx, ag, n_teams)
+    goals_against = scatter_add(home_idx, ag, n_teams) + scatter_add(away_idx, hg, n_teams)
+
+    tied = points[:, home_idx] == points[:, away_idx]
+    h2h_points = scatter_add(home_idx, pts_home * tied, n_teams) + scatter_add(away_idx, pts_away * tied, n_teams)
+    h2h_gd = scatter_add(home_idx, (hg - ag) * tied, n_teams) + scatter_add(away_idx, (ag - hg) * tied, n_teams)
+
+    sim = np.repeat(np.arange(n_sims), n_teams)
+    order = np.lexsort((
+        rng.random(n_sims * n_teams),
+        -goals_for.ravel(),
+        -(goals_for - goals_against).ravel(),
+        -h2h_gd.ravel(),
+        -h2h_points.ravel(),
+        -points.ravel(),
+        sim,
+    ))
+    positions = np.empty(n_sims * n_teams, dtype=np.int64)
+    positions[order] = np.tile(np.arange(n_teams), n_sims)
+    return positions.reshape(n_sims, n_teams), points
+
+
+def simulate_shard(played : tuple, remaining : tuple, cum_probs : np.ndarray, goals : tuple, n_teams : int,
+                   n_sims : int, seed):
+    """
+    Runs n_sims season completions in chunks and returns the position counts (teams x positions)
+    and the sum of final points per team
+    """
+    rng = np.random.default_rng(seed)
+    home_played, away_played, hg_played, ag_played = played
+    home_rem, away_rem = remaining
+    goals_home, goals_away = goals
+    home_idx = np.concatenate([home_played, home_rem])
+    away_idx = np.concatenate([away_played, away_rem])
+
+    counts = np.zeros((n_teams, n_teams), dtype=np.int64)
+    points_sum = np.zeros(n_teams)
+    done = 0
+    while done < n_sims:
+        size = min(CHUNK_SIMS, n_sims - done)
+        classes = sample_classes(cum_probs, size, rng)
+        hg = np.hstack([np.broadcast_to(hg_played, (size, len(hg_played))), goals_home[classes]])
+        ag = np.hstack([np.broadcast_to(ag_played, (size, len(ag_played))), goals_away[classes]])
+
+        positions, points = final_positions(home_idx, away_idx, hg, ag, n_teams, rng)
+        counts += np.bincount((np.arange(n_teams)[None, :] * n_teams + positions).ravel(),
+                              minlength=n_teams * n_teams).reshape(n_teams, n_teams)
+        points_sum += points.sum(axis=0)
+        done += size
+    return counts, points_sum
+
+
+def simulate_season(fixtures : pd.DataFrame, probs : np.ndarray, labels : list[str], n_sims=100_000,
+                    n_jobs=None, seed=42, europe=6, relegation=3):
+    """
+    Monte Carlo of the rest of a season. fixtures has HomeTeam, AwayTeam, FTHG, FTAG (NaN when
+    not played); probs has one row per unplayed fixture and one column per label.
+    Simulations are sharded across processes.
+    """
+    teams = pd.Index(sorted(pd.concat([fixtures["HomeTeam"], fixtures["AwayTeam"]]).unique()))
+    n_teams = len(teams)
+    is_played = fixtures["FTHG"].notna() & fixtures["FTAG"].notna()
+    done, todo = fixtures[is_played], fixtures[~is_played]
+    if len(probs) != len(todo):
+        raise ValueError(f"Got {len(probs)} probability rows for {len(todo)} unplayed fixtures")
+
+    played = (
+        teams.get_indexer(done["HomeTeam"]), teams.get_indexer(done["AwayTeam"]),
+        done["FTHG"].to_numpy(dtype=np.int16), done["FTAG"].to_numpy(dtype=np.int16),
+    )
+    remaining = (teams.get_indexer(todo["HomeTeam"]), teams.get_indexer(todo["AwayTeam"]))
+    probs = fill_missing(probs)
+    cum_probs = np.cumsum(probs / probs.sum(axis=1, keepdims=True), axis=1)
+    goals = class_goals(labels)
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    shards = [n_sims // n_jobs + (1 if i < n_sims % n_jobs else 0) for i in range(n_jobs)]
+    seeds = np.random.SeedSequence(seed).spawn(len(shards))
+
+    if n_jobs == 1:
+        results = [simulate_shard(played, remaining, cum_probs, goals, n_teams, shards[0], seeds[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(
+                simulate_shard,
+                [played] * n_jobs, [remaining] * n_jobs, [cum_probs] * n_jobs, [goals] * n_jobs,
+                [n_teams] * n_jobs, shards, seeds,
+            ))
+
+    counts = sum(r[0] for r in results)
+    points_sum = sum(r[1] for r in results)
+    position_probs = counts / n_sims
+
+    table = pd.DataFrame({
+        "team": teams,
+        "expected_points": points_sum / n_sims,
+        "title": position_probs[:, 0],
+        "europe": position_probs[:, :europe].sum(axis=1),
+        "relegation": position_probs[:, n_teams - relegation:].sum(axis=1),
+    })
+    positions = pd.DataFrame(position_probs, columns=[f"pos_{i + 1}" for i in range(n_teams)])
+    table = pd.concat([table, positions], axis=1)
+    return table.sort_values("expected_points", ascending=False).reset_index(drop=True)
+
+
+def fixture_probabilities(todo : pd.DataFrame, source : str):
+    """
+    Probabilities of the unplayed fixtures: bookmaker H/D/A (market), Dixon-Coles result_abstract
+    (scoreline) or the trained model from predict.py (model). Fixtures without odds take the
+    Dixon-Coles H/D/A when available, else uniform.
+    """
+    if source == "market":
+        probs = todo[MARKET_COLUMNS].to_numpy(dtype=np.float64)
+        missing = missing_rows(probs)
+        if missing.any():
+            fallback = None
+            if all(c in todo.columns for c in SCORELINE_OUTCOME_COLUMNS):
+                fallback = todo[SCORELINE_OUTCOME_COLUMNS].to_numpy(dtype=np.float64)
+            probs = fill_missing(probs, fallback)
+            print(f"{missing.sum()} partidos sin cuotas: probabilidades de Dixon-Coles o uniformes")
+        return probs, ["H", "D", "A"]
+    if source == "scoreline":
+        import scoreline_model
+        cols = [f"dc_prob_{c.replace('-', '_')}" for c in scoreline_model.RESULT_CLASSES]
+        return todo[cols].to_numpy(), scoreline_model.RESULT_CLASSES
+    if source == "model":
+        import predict
+        bundle, snapshot = predict.load_model(), predict.load_snapshot()
+        odds_cols = ["B365H", "B365D", "B365A"]
+        odds = todo[odds_cols].to_numpy() if all(c in todo.columns for c in odds_cols) else None
+        probs, imputed = predict.predict_fixtures(bundle, snapshot, todo["HomeTeam"].tolist(),
+                                                  todo["AwayTeam"].tolist(), todo["Date"].astype(str).tolist(), odds)
+        if imputed.any():
+            print(f"{imputed.sum()} partidos sin cuotas: mercado de los últimos partidos de los equipos")
+        return probs, bundle["classes"]
+    raise ValueError(f"Unknown source {source}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of the rest of a season")
+    parser.add_argument("--fixtures", default=None, help="CSV with the season fixtures (default laliga_features.csv)")
+    parser.add_argument("--season", default=None, help="Season to simulate, e.g. 2024_25 (default the last one)")
+    parser.add_argument("--as-of", default=None, help="Matches from this date on are simulated (YYYY-MM-DD)")
+    parser.add_argument("--source", choices=["market", "scoreline", "model"], default="market")
+    parser.add_argument("--sims", type=int, default=100_000)
+    parser.add_argument("--n-jobs", type=int, default=None)
+    parser.add_argument("--europe", type=int, default=6, help="Positions with European spot")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    path = args.fixtures or os.path.join(base_dir, '..', 'data', 'processed', 'laliga_features.csv')
+    df = pd.read_csv(os.path.normpath(path))
+    if "Season" in df.columns:
+        season = args.season or sorted(df["Season"].dropna().unique())[-1]
+        df = df[df["Season"] == season]
+    df = df.copy()
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    df = df.sort_values("Date", kind="mergesort").reset_index(drop=True)
+    if args.as_of:
+        future = df["Date"] >= pd.Timestamp(args.as_of)
+        df.loc[future, ["FTHG", "FTAG"]] = np.nan
+
+    todo = df[df["FTHG"].isna() | df["FTAG"].isna()]
+    probs, labels = fixture_probabilities(todo, args.source)
+
+    start = time.perf_counter()
+    table = simulate_season(df, probs, labels, args.sims, args.n_jobs, args.seed, args.europe)
+    print(f"{args.sims} simulaciones de {len(todo)} partidos en {time.perf_counter() - start:.2f}s")
+
+    pd.set_option('display.width', None)
+    print(table[["team", "expected_points", "title", "europe", "relegation"]].to_string(
+        index=False, float_format=lambda v: f"{v:.3f}"))
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"Archivo guardado en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
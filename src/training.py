@@ -0,0 +1,382 @@
+# ==========================================================
+#  training.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import compact_schema
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+cache_dir = os.path.normpath(os.path.join(base_dir, '..', 'data', 'cache'))
+models_dir = os.path.normpath(os.path.join(base_dir, '..', 'models'))
+
+TARGET = "result_abstract"
+TEST_SEASONS = ["2023_24", "2024_25"]
+
+# Same feature list as Modelling.ipynb
+FEATURE_SELECTION = [
+    # ELO
+    "elo_home", "elo_away", "elo_diff",
+
+    # Forma ofensiva/defensiva (rolling 7 partidos)
+    "home_avg_goals_scored_7", "away_avg_goals_scored_7",
+    "home_avg_goals_conceded_7", "away_avg_goals_conceded_7",
+    "goal_diff_form_home", "goal_diff_form_away",
+    "total_avg_goals",
+
+    # Disparos
+    "home_avg_shots_7", "away_avg_shots_7",
+    "home_avg_shots_on_target_7", "away_avg_shots_on_target_7",
+    "shots_on_target_ratio_home", "shots_on_target_ratio_away",
+
+    # Corners y disciplina
+    "home_avg_corners_7", "away_avg_corners_7",
+    "home_avg_fouls_7", "away_avg_fouls_7",
+    "home_avg_yellows_7", "away_avg_yellows_7",
+    "home_avg_reds_7", "away_avg_reds_7",
+
+    # Índices de fuerza
+    "attack_strength_home", "attack_strength_away",
+    "defense_strength_home", "defense_strength_away",
+    "discipline_index_home", "discipline_index_away",
+    "attack_vs_defense_home", "attack_vs_defense_away",
+
+    # Valor de mercado
+    "home_team_value", "away_team_value",
+    "team_value_diff", "team_value_ratio",
+
+    # Cuotas de apuestas
+    "B365H_prob", "B365D_prob", "B365A_prob",
+    "prob_diff_home_away", "prob_fav_margin",
+
+    # Contexto
+    "derby",
+]
+
+# param_grid_fino from Modelling.ipynb
+PARAM_GRID = {
+    'n_estimators' : [150,200,300],
+    'max_depth' : [5,6,7],
+    'min_samples_leaf' : [25,30,35],
+    'min_samples_split' : [15,20,25],
+    'max_features' : [0.2,0.3,0.4],
+}
+
+
+def load_features(path=None):
+    return compact_schema.read_features(path)
+
+
+def prior_season_median(df : pd.DataFrame, col : str):
+    """
+    Median of the nonzero values of col in the same season over the matches played before each
+    row (earlier dates only), the zeros being the missing values to impute as in the notebook.
+    The first matchday of a season takes the median of the previous season. df is sorted by Date.
+    """
+    result = np.full(len(df), np.nan)
+    previous = np.nan
+    for season, rows in sorted(df.groupby("Season").indices.items()):
+        values = df[col].iloc[rows].reset_index(drop=True).replace(0, np.nan)
+        dates = df["Date"].iloc[rows].reset_index(drop=True)
+        # Median after the last match of each date, shifted to the next date
+        by_date = values.expanding().median().groupby(dates).last().shift(1)
+        result[rows] = dates.map(by_date).fillna(previous).to_numpy()
+        previous = values.median()
+    return result
+
+
+def clean_features(df : pd.DataFrame, prior_only=False):
+    """
+    Same cleaning as the notebook: drops the cold-start matches (no rolling averages yet)
+    and puts the teams with value 0 to the season median.
+    prior_only=True uses the median of the matches played before each one instead, so the
+    walk-forward backtest doesn't see values from after its retrain points.
+    """
+    df = df[df["home_avg_goals_scored_7"].notna() & (df["home_avg_goals_scored_7"] != 0)].copy()
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    df = df.sort_values("Date", kind="mergesort").reset_index(drop=True)
+    for col in ["home_team_value", "away_team_value"]:
+        if col not in df.columns:
+            continue
+        if prior_only:
+            df[col] = df[col].mask(df[col] == 0, prior_season_median(df, col))
+        else:
+            df[col] = df.groupby("Season")[col].transform(
+                lambda x: x.replace(0, np.nan).fillna(x.median())
+            )
+    return df
+
+
+def feature_matrix(df : pd.DataFrame, features : list[str]):
+    """
+    Contiguous float32 matrix with the selected features (the forests work on float32 internally)
+    """
+    missing = [c for c in features if c not in df.columns]
+    if missing:
+        raise KeyError(f"Missing feature columns: {missing}")
+    return np.ascontiguousarray(df[features].to_numpy(dtype=np.float32))
+
+
+def data_hash(df : pd.DataFrame, features : list[str], n_splits : int, test_seasons : list[str]):
+    """
+    Hash of the exact training data (values, feature order, folds and holdout), used as cache key
+    """
+    h = hashlib.sha1()
+    h.update(json.dumps([features, n_splits, sorted(test_seasons)]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df[features + [TARGET, "Season"]], index=False).values.tobytes())
+    return h.hexdigest()[:16]
+
+
+def time_series_folds(n_samples : int, n_splits : int):
+    """
+    Fold bounds (train_end, test_end) equivalent to sklearn's TimeSeriesSplit:
+    train is [0, train_end) and test is [train_end, test_end)
+    """
+    from sklearn.model_selection import TimeSeriesSplit
+
+    bounds = []
+    for train_idx, test_idx in TimeSeriesSplit(n_splits=n_splits).split(np.empty((n_samples, 1))):
+        bounds.append((train_idx[-1] + 1, test_idx[-1] + 1))
+    return np.asarray(bounds, dtype=np.int64)
+
+
+def build_fold_cache(df : pd.DataFrame, features=FEATURE_SELECTION, n_splits=8, test_seasons=TEST_SEASONS, use_cache=True):
+    """
+    Precomputes the train/test matrices, the encoded target and the CV fold index.
+    They are stored in data/cache keyed by the data hash, so the next runs only load them.
+    use_cache=False ignores the cached file and overwrites it with the rebuilt one.
+    """
+    key = data_hash(df, features, n_splits, test_seasons)
+    path = os.path.join(cache_dir, f"folds_{key}.npz")
+
+    if use_cache and os.path.exists(path):
+        with np.load(path, allow_pickle=False) as cached:
+            data = {name: cached[name] for name in cached.files}
+        data["key"] = key
+        data["features"] = list(features)
+        return data
+
+    train = df[~df["Season"].isin(test_seasons)]
+    test = df[df["Season"].isin(test_seasons)]
+
+    classes, y_train = np.unique(train[TARGET].astype(str).to_numpy(), return_inverse=True)
+    # Labels never seen in train are encoded as -1
+    y_test = pd.Categorical(test[TARGET].astype(str), categories=classes).codes
+
+    data = {
+        "X_train": feature_matrix(train, features),
+        "y_train": y_train.astype(np.int64),
+        "X_test": feature_matrix(test, features),
+        "y_test": y_test.astype(np.int64),
+        "classes": classes.astype(str),
+        "folds": time_series_folds(len(train), n_splits),
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(path, **data)
+
+    data["key"] = key
+    data["features"] = list(features)
+    return data
+
+
+def params_key(params : dict):
+    return json.dumps(params, sort_keys=True)
+
+
+def load_trials(key : str):
+    """
+    Trials already evaluated on the same data: {(params_key, fold): score}
+    """
+    path = os.path.join(cache_dir, f"trials_{key}.jsonl")
+    trials = {}
+    if not os.path.exists(path):
+        return trials
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            trials[(params_key(record["params"]), record["fold"])] = record["score"]
+    return trials
+
+
+def save_trials(key : str, records : list[dict]):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"trials_{key}.jsonl")
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def make_model(params : dict, n_jobs=1):
+    from sklearn.ensemble import RandomForestClassifier
+
+    return RandomForestClassifier(random_state=42, n_jobs=n_jobs, **params)
+
+
+def fit_fold(X : np.ndarray, y : np.ndarray, bounds : np.ndarray, params : dict):
+    """
+    Fits one config on one fold and returns its accuracy.
+    Slicing the contiguous rows gives views, no copy of the matrix.
+    """
+    train_end, test_end = bounds
+    model = make_model(params)
+    model.fit(X[:train_end], y[:train_end])
+    return float((model.predict(X[train_end:test_end]) == y[train_end:test_end]).mean())
+
+
+def evaluate_configs(data : dict, configs : list[dict], folds : list[int], trials : dict, n_jobs=-1):
+    """
+    Mean CV accuracy for each config over the given folds.
+    Only the (config, fold) pairs missing in trials are fitted, and the new ones are persisted.
+    """
+    from joblib import Parallel, delayed
+
+    pending = [
+        (params, fold) for params in configs for fold in folds
+        if (params_key(params), fold) not in trials
+    ]
+    if pending:
+        # Results are persisted as they arrive, an interrupted search keeps its finished fits
+        scores = Parallel(n_jobs=n_jobs, return_as="generator")(
+            delayed(fit_fold)(data["X_train"], data["y_train"], data["folds"][fold], params)
+            for params, fold in pending
+        )
+        for (params, fold), score in zip(pending, scores):
+            trials[(params_key(params), fold)] = score
+            save_trials(data["key"], [{"params": params, "fold": fold, "score": score}])
+
+    print(f"  {len(configs)} configs x {len(folds)} folds: {len(pending)} fits, "
+          f"{len(configs) * len(folds) - len(pending)} reused")
+    return [float(np.mean([trials[(params_key(params), fold)] for fold in folds])) for params in configs]
+
+
+def grid_configs(param_grid : dict):
+    names = list(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(param_grid[n] for n in names))]
+
+
+def grid_search(data : dict, param_grid=PARAM_GRID, n_jobs=-1):
+    """
+    Exhaustive search, every config on every fold (as GridSearchCV in the notebook)
+    """
+    configs = grid_configs(param_grid)
+    trials = load_trials(data["key"])
+    folds = list(range(len(data["folds"])))
+    scores = evaluate_configs(data, configs, folds, trials, n_jobs)
+    best = int(np.argmax(scores))
+    return configs[best], scores[best]
+
+
+def successive_halving(data : dict, param_grid=PARAM_GRID, eta=3, n_jobs=-1):
+    """
+    Successive halving using the CV folds as resource. Every round evaluates the surviving
+    configs on more folds (the most recent ones first) and keeps the best 1/eta of them.
+    The last round uses all the folds, so its scores are comparable with grid_search.
+    """
+    configs = grid_configs(param_grid)
+    trials = load_trials(data["key"])
+    n_splits = len(data["folds"])
+
+    n_rounds = max(1, math.ceil(math.log(len(configs), eta)))
+    budgets = sorted({max(1, n_splits // eta ** k) for k in range(n_rounds)})
+
+    scores = []
+    for i, budget in enumerate(budgets):
+        folds = list(range(n_splits - budget, n_splits))
+        print(f"Round {i + 1}/{len(budgets)}: {len(configs)} configs on the last {budget} folds")
+        scores = evaluate_configs(data, configs, folds, trials, n_jobs)
+        if i < len(budgets) - 1:
+            keep = max(1, len(configs) // eta)
+            order = np.argsort(scores, kind="stable")[::-1][:keep]
+            configs = [configs[j] for j in order]
+
+    best = int(np.argmax(scores))
+    return configs[best], scores[best]
+
+
+def fit_final(data : dict, params : dict):
+    """
+    Refits the best config on the whole train set and evaluates the holdout seasons
+    """
+    from sklearn.metrics import top_k_accuracy_score
+
+    model = make_model(params, n_jobs=-1)
+    model.fit(data["X_train"], data["y_train"])
+
+    metrics = {}
+    known = data["y_test"] >= 0
+    if known.any():
+        X_test, y_test = data["X_test"][known], data["y_test"][known]
+        proba = model.predict_proba(X_test)
+        metrics["top1"] = float((model.predict(X_test) == y_test).mean())
+        metrics["top3"] = float(top_k_accuracy_score(y_test, proba, k=3, labels=model.classes_))
+    return model, metrics
+
+
+def save_model(model, data : dict, params : dict, metrics : dict, path=None):
+    import joblib
+
+    if path is None:
+        path = os.path.join(models_dir, 'rf_result_abstract.joblib')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    joblib.dump({
+        "model": model,
+        "features": data["features"],
+        "classes": [str(c) for c in data["classes"]],
+        "params": params,
+        "metrics": metrics,
+        "data_key": data["key"],
+    }, path)
+    print(f"Modelo guardado en {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trains the result_abstract RandomForest")
+    parser.add_argument("--features", default=None, help="Path to laliga_features.csv")
+    parser.add_argument("--search", choices=["grid", "halving"], default="halving")
+    parser.add_argument("--n-splits", type=int, default=8)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--no-cache", action="store_true", help="Rebuilds the fold cache")
+    parser.add_argument("--output", default=None, help="Path of the serialized model")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    df = clean_features(load_features(args.features))
+    data = build_fold_cache(df, FEATURE_SELECTION, args.n_splits, TEST_SEASONS, use_cache=not args.no_cache)
+    print(f"Train: {data['X_train'].shape[0]} partidos, Test: {data['X_test'].shape[0]} partidos "
+          f"({data['X_train'].shape[1]} features, cache {data['key']})")
+
+    if args.search == "grid":
+        params, score = grid_search(data, PARAM_GRID, args.n_jobs)
+    else:
+        params, score = successive_halving(data, PARAM_GRID, args.eta, args.n_jobs)
+
+    print("Mejores hiperparámetros encontrados")
+    for k, v in params.items():
+        print(f"  {k}: {v}")
+    print(f"Mejor accuracy en CV: {score:.4f}")
+
+    model, metrics = fit_final(data, params)
+    for name, value in metrics.items():
+        print(f"Accuracy {name}: {value:.4f}")
+    save_model(model, data, params, metrics, args.output)
+    print(f"Tiempo total: {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# ==========================================================
+#  validation.py
+#  Football Prediction
+#  Author: Manuel Avilés Rodríguez
+# ==========================================================
+
+import argparse
+import ast
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import compact_schema
+
+# Global variable for directory
+base_dir = os.path.dirname(os.path.abspath(__file__))
+processed_dir = os.path.normpath(os.path.join(base_dir, '..', 'data', 'processed'))
+report_path = os.path.normpath(os.path.join(base_dir, '..', 'data', 'reports', 'validation.json'))
+
+MATCH_KEY = ['Date', 'HomeTeam', 'AwayTeam']
+LINEUP_COLUMNS = ['Home_Lineup_List', 'Away_Lineup_List']
+STATUS_ORDER = {'ok': 0, 'skipped': 0, 'warn': 1, 'fail': 2}
+
+# Checks of every artifact of data/processed. Each check measures the rate of bad rows
+# (or, with 'by', the worst rate of any group) and compares it with its thresholds:
+#   warn : rate above it is a warning (default 0)
+#   fail : rate above it fails the stage (default 0, any bad row)
+#   optional : the check is skipped when its columns are missing (stages that add them later)
+RULES = {
+    'LaLiga_combined.csv': [
+        {'check': 'unique', 'columns': MATCH_KEY},
+        {'check': 'not_null', 'columns': MATCH_KEY + ['FTHG', 'FTAG', 'FTR']},
+        {'check': 'allowed', 'columns': ['FTR', 'HTR'], 'values': ['H', 'D', 'A']},
+        {'check': 'result', 'columns': ['FTHG', 'FTAG', 'FTR']},
+        {'check': 'range', 'columns': ['FTHG', 'FTAG', 'HTHG', 'HTAG'], 'min': 0, 'max': 15},
+        {'check': 'range', 'columns': ['HS', 'AS', 'HST', 'AST', 'HF', 'AF', 'HC', 'AC'], 'min': 0, 'max': 60},
+        {'check': 'range', 'columns': ['HY', 'AY', 'HR', 'AR'], 'min': 0, 'max': 12},
+        {'check': 'range', 'columns': ['B365H', 'B365D', 'B365A'], 'min': 1.0, 'max': 100, 'fail': 0.01},
+    ],
+    'laliga_features.csv': [
+        {'check': 'unique', 'columns': MATCH_KEY},
+        {'check': 'not_null', 'columns': MATCH_KEY + ['Season', 'result_abstract']},
+        {'check': 'coverage', 'columns': MATCH_KEY, 'reference': 'LaLiga_combined.csv'},
+        {'check': 'range', 'columns': ['elo_home', 'elo_away'], 'min': 1000, 'max': 2200},
+        {'check': 'range', 'columns': ['B365H_prob', 'B365D_prob', 'B365A_prob'], 'min': 0, 'max': 1},
+        {'check': 'range', 'columns': ['market_prob_home', 'market_prob_draw', 'market_prob_away', 'market_prob_over25'],
+         'min': 0, 'max': 1, 'optional': True},
+        # The lineups live in laliga_features_lineups.npz, only the features stage and
+        # read_features(lineups=True) have them as columns
+        {'check': 'lineup_length', 'columns': LINEUP_COLUMNS, 'size': 11, 'fail': 0.01, 'optional': True},
+        # merge_lineups only prints its match rate
+        {'check': 'non_empty', 'columns': LINEUP_COLUMNS, 'by': 'Season', 'warn': 0.02, 'fail': 0.25,
+         'optional': True},
+        # match_player_value gives 0.0 when a player isn't found, a whole lineup without matches is a 0 team value
+        {'check': 'zero_rate', 'columns': ['home_team_value', 'away_team_value'], 'by': 'Season',
+         'warn': 0.02, 'fail': 0.25, 'optional': True},
+    ],
+    'players_with_market_values.csv': [
+        {'check': 'not_null', 'columns': ['name', 'team', 'Season']},
+        {'check': 'unique', 'columns': ['name', 'team', 'Season'], 'fail': 0.01},
+        {'check': 'range', 'columns': ['market_value'], 'min': 0, 'max': 3e8},
+        # parse_market_values gives 0.0 for values it can't read
+        {'check': 'zero_rate', 'columns': ['market_value'], 'by': 'Season', 'warn': 0.10, 'fail': 0.30},
+    ],
+    'players_info.csv': [
+        {'check': 'unique', 'columns': ['href']},
+        {'check': 'not_null', 'columns': ['name', 'href']},
+        {'check': 'range', 'columns': ['height'], 'min': 150, 'max': 215},
+        {'check': 'range', 'columns': ['weight'], 'min': 45, 'max': 120},
+    ],
+    # get_info_from_matches skips the rows whose matches it can't read
+    'matches_info.csv': [
+        {'check': 'literal_list', 'columns': ['matches'], 'fail': 0.05},
+    ],
+    'matches_lineups.csv': [
+        {'check': 'unique', 'columns': ['date_time', 'home_team', 'away_team']},
+        {'check': 'lineup_length', 'columns': ['home_lineup', 'away_lineup'], 'size': 11, 'fail': 0.01},
+        {'check': 'non_empty', 'columns': ['home_lineup', 'away_lineup'], 'fail': 0.01},
+    ],
+    'matches_final_info.csv': [
+        {'check': 'unique', 'columns': MATCH_KEY},
+        {'check': 'lineup_length', 'columns': ['home_lineup_names', 'away_lineup_names'], 'size': 11, 'fail': 0.01},
+    ],
+}
+
+
+def lineup_lengths(values : pd.Series):
+    """
+    Players of each lineup, whether the column holds lists or their string form ("['A', 'B']")
+    """
+    is_list = values.map(lambda v: isinstance(v, list)).to_numpy(dtype=bool)
+    text = values.where(~is_list, '').fillna('').astype(str).str.strip()
+    lengths = (text.str.count(r"""['"], ['"]""") + 1).where(~text.isin(['', '[]']), 0)
+    lengths = lengths.to_numpy(dtype=np.int64, copy=True)
+    if is_list.any():
+        lengths[is_list] = values[is_list].map(len).to_numpy()
+    return lengths
+
+
+def is_literal_list(value):
+    """Whether the value is a list or the string form of a list of dicts, as get_info_from_matches reads it"""
+    if isinstance(value, list):
+        return True
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return False
+    return isinstance(parsed, list) and all(isinstance(m, dict) for m in parsed)
+
+
+def key_index(df : pd.DataFrame, columns : list[str]):
+    keys = pd.DataFrame({
+        c: df[c].dt.strftime('%Y-%m-%d') if pd.api.types.is_datetime64_any_dtype(df[c]) else df[c].astype(str)
+        for c in columns
+    })
+    return pd.MultiIndex.from_frame(keys)
+
+
+def load_reference(name : str):
+    path = os.path.join(processed_dir, name)
+    return pd.read_csv(path) if os.path.exists(path) else None
+
+
+def bad_rows(df : pd.DataFrame, rule : dict, references=None):
+    """
+    Boolean mask of the rows that break the rule (for coverage, the rows of the reference
+    missing in df) and the frame the mask refers to
+    """
+    check, columns = rule['check'], rule['columns']
+    if check == 'unique':
+        return df.duplicated(subset=columns, keep=False).to_numpy(), df
+    if check == 'not_null':
+        return df[columns].isna().any(axis=1).to_numpy(), df
+    if check == 'range':
+        values = df[columns].to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            return ((values < rule['min']) | (values > rule['max'])).any(axis=1), df
+    if check == 'allowed':
+        return (df[columns].notna() & ~df[columns].isin(rule['values'])).any(axis=1).to_numpy(), df
+    if check == 'result':
+        # Rows with missing goals or result can't be checked and count as bad (nullable Int8/Int16
+        # goals can't be compared with NA either)
+        home, away, result = columns
+        missing = df[columns].isna().any(axis=1).to_numpy()
+        h = pd.to_numeric(df[home], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        a = pd.to_numeric(df[away], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(invalid='ignore'):
+            expected = np.select([h > a, h < a], ['H', 'A'], 'D')
+        return missing | (df[result].astype(str).to_numpy() != expected), df
+    if check == 'literal_list':
+        return ~df[columns].map(is_literal_list).all(axis=1).to_numpy(), df
+    if check == 'lineup_length':
+        lengths = np.column_stack([lineup_lengths(df[c]) for c in columns])
+        return ((lengths > 0) & (lengths != rule['size'])).any(axis=1), df
+    if check == 'non_empty':
+        return np.column_stack([lineup_lengths(df[c]) == 0 for c in columns]).any(axis=1), df
+    if check == 'zero_rate':
+        return (df[columns].to_numpy(dtype=np.float64) == 0).any(axis=1), df
+    if check == 'coverage':
+        reference = (references or {}).get(rule['reference'])
+        if reference is None:
+            reference = load_reference(rule['reference'])
+        if reference is None:
+            return None, None
+        return ~key_index(reference, columns).isin(key_index(df, columns)), reference
+    raise ValueError(f"Unknown check {check}")
+
+
+def run_rule(df : pd.DataFrame, rule : dict, references=None):
+    result = {'check': rule['check'], 'columns': rule['columns']}
+    needed = rule['columns'] + ([rule['by']] if 'by' in rule else [])
+    missing = [c for c in needed if c not in df.columns]
+    if missing:
+        result.update({'status': 'skipped' if rule.get('optional') else 'fail', 'missing_columns': missing})
+        return result
+
+    bad, frame = bad_rows(df, rule, references)
+    if bad is None:
+        result.update({'status': 'skipped', 'detail': f"no {rule['reference']}"})
+        return result
+
+    warn, fail = rule.get('warn', 0.0), rule.get('fail', 0.0)
+    rate = float(bad.mean()) if len(bad) else 0.0
+    result.update({'rows': int(len(bad)), 'bad': int(bad.sum()), 'rate': rate, 'warn': warn, 'fail': fail})
+    if 'by' in rule:
+        groups = pd.Series(bad).groupby(frame[rule['by']].astype(str).to_numpy()).mean()
+        result['groups'] = {g: round(float(r), 4) for g, r in groups[groups > warn].items()}
+        rate = float(groups.max()) if len(groups) else 0.0
+        result['worst_group_rate'] = rate
+    result['status'] = 'fail' if rate > fail else 'warn' if rate > warn else 'ok'
+    return result
+
+
+def validate_frame(df : pd.DataFrame, name : str, references=None):
+    """
+    Runs the rules of an artifact on a frame. references ({artifact: frame}) avoids reading
+    the reference artifacts of the coverage checks from disk.
+    """
+    start = time.perf_counter()
+    checks = [run_rule(df, rule, references) for rule in RULES[name]]
+    status = max((c['status'] for c in checks), key=STATUS_ORDER.get, default='ok')
+    return {'rows': int(len(df)), 'status': status, 'ms': round((time.perf_counter() - start) * 1000, 2),
+            'checks': checks}
+
+
+def describe_check(check : dict):
+    columns = ', '.join(check['columns'])
+    if 'missing_columns' in check:
+        return f"{check['check']}({columns}): missing columns {check['missing_columns']}"
+    if 'rate' not in check:
+        return f"{check['check']}({columns}): {check.get('detail', '')}"
+    text = f"{check['check']}({columns}): {check['bad']}/{check['rows']} ({check['rate']:.2%})"
+    if check.get('groups'):
+        worst = sorted(check['groups'].items(), key=lambda item: -item[1])[:5]
+        text += " peores: " + ', '.join(f"{g} {r:.1%}" for g, r in worst)
+    return text
+
+
+def print_result(name : str, result : dict, verbose=False):
+    print(f"  {name:<32} {result['status']:<5} {result['rows']:>6} filas {result['ms']:7.2f} ms")
+    for check in result['checks']:
+        if verbose or check['status'] in ('warn', 'fail'):
+            print(f"      [{check['status']}] {describe_check(check)}")
+
+
+def check_stage(df : pd.DataFrame, name : str, references=None, strict=False):
+    """
+    Validation at the end of a pipeline stage, before its artifact is written.
+    Raises ValueError when a check fails (or warns, with strict=True).
+    """
+    result = validate_frame(df, name, references)
+    print_result(name, result)
+    limit = 'warn' if strict else 'fail'
+    failed = [c for c in result['checks'] if STATUS_ORDER[c['status']] >= STATUS_ORDER[limit]]
+    if failed:
+        raise ValueError(f"Validation of {name} failed: " + "; ".join(describe_check(c) for c in failed))
+    return result
+
+
+def read_artifact(name : str):
+    path = os.path.join(processed_dir, name)
+    if name == 'laliga_features.csv':
+        return compact_schema.read_features(path, lineups=os.path.exists(path.replace('.csv', '_lineups.npz')))
+    return pd.read_csv(path, low_memory=False)
+
+
+def validate_artifacts(names=None):
+    """
+    Validates the artifacts of data/processed. Each one is read once and reused as the
+    reference of the coverage checks.
+    """
+    names = names or [n for n in RULES if os.path.exists(os.path.join(processed_dir, n))]
+    frames = {n: read_artifact(n) for n in names}
+    return {n: validate_frame(frames[n], n, frames) for n in names}
+
+
+def write_report(results : dict, path=report_path):
+    status = max((r['status'] for r in results.values()), key=STATUS_ORDER.get, default='ok')
+    report = {'generated': time.strftime('%Y-%m-%dT%H:%M:%S'), 'status': status, 'artifacts': results}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Archivo guardado en {path}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Data-quality checks of the data/processed artifacts")
+    parser.add_argument("artifacts", nargs='*', help=f"Artifacts to check (default all of {list(RULES)})")
+    parser.add_argument("--output", default=report_path, help="JSON report")
+    parser.add_argument("--strict", action="store_true", help="Warnings also give a non-zero exit code")
+    parser.add_argument("--verbose", action="store_true", help="Prints the checks that pass too")
+    args = parser.parse_args(argv)
+
+    unknown = [a for a in args.artifacts if a not in RULES]
+    if unknown:
+        parser.error(f"No rules for {unknown}")
+
+    start = time.perf_counter()
+    results = validate_artifacts(args.artifacts)
+    for name, result in results.items():
+        print_result(name, result, args.verbose)
+    report = write_report(results, args.output)
+    print(f"Validación: {report['status']} en {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    if STATUS_ORDER[report['status']] >= STATUS_ORDER['warn' if args.strict else 'fail']:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()